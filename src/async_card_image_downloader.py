@@ -0,0 +1,329 @@
+import asyncio
+from urllib.parse import urljoin, urlsplit
+from card_image_downloader import ImageFailureReason
+from http_client import HTTPClient, HTTPClientError
+
+class AsyncHTTPClient():
+    # HTTPClientのasyncio版。1スレッドで多数のダウンロードを並行して行う
+    RETRY_STATUSES = HTTPClient.RETRY_STATUSES
+    REDIRECT_STATUSES = HTTPClient.REDIRECT_STATUSES
+    MAX_REDIRECTS = HTTPClient.MAX_REDIRECTS
+    USER_AGENT = HTTPClient.USER_AGENT
+
+    def __init__(self, max_connections=16, max_idle_per_host=4, timeout=10, retries=3, backoff=0.5):
+        self.max_connections = max_connections
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.__loop = None
+        self.__semaphore = None
+        self.__idle_connections = {}
+        self.requests = 0
+        self.reused_connections = 0
+        self.retried_requests = 0
+
+    async def get(self, url):
+        for _ in range(self.MAX_REDIRECTS + 1):
+            status, location, body = await self.__get_with_retries(url)
+            if status in self.REDIRECT_STATUSES and location:
+                url = urljoin(url, location)
+                continue
+            if status != 200:
+                raise HTTPClientError(url + ": HTTP " + str(status), status)
+            return body
+        raise HTTPClientError(url + ": Too many redirects")
+
+    async def __get_with_retries(self, url):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.retried_requests += 1
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)))
+            try:
+                status, location, body = await self.__request(url)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+                error = HTTPClientError(url + ": " + repr(e))
+                continue
+            if status in self.RETRY_STATUSES:
+                error = HTTPClientError(url + ": HTTP " + str(status), status)
+                continue
+            return status, location, body
+        raise error
+
+    async def __request(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ["http", "https"] or not parts.hostname:
+            raise HTTPClientError(url + ": Unsupported URL")
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop:
+            # 接続と同時リクエスト数の制限はイベントループ毎に持つ
+            self.__loop = loop
+            self.__semaphore = asyncio.Semaphore(self.max_connections)
+            self.__idle_connections = {}
+        async with self.__semaphore:
+            # タイムアウトは同時リクエスト数の空き待ちを含めず、1リクエスト毎に測る
+            return await asyncio.wait_for(self.__request_with_connection(key, path, parts.netloc), self.timeout)
+
+    async def __request_with_connection(self, key, path, host):
+        connection, is_reused = await self.__acquire_connection(key)
+        try:
+            try:
+                status, headers, body, will_close = await self.__send(connection, path, host)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not is_reused:
+                    raise
+                # 待機中にサーバーから切断された接続であれば、新しい接続でやり直す
+                connection[1].close()
+                connection, is_reused = await self.__new_connection(key), False
+                status, headers, body, will_close = await self.__send(connection, path, host)
+        except BaseException:
+            connection[1].close()
+            raise
+        self.requests += 1
+        if is_reused:
+            self.reused_connections += 1
+        if will_close:
+            connection[1].close()
+        else:
+            self.__release_connection(key, connection)
+        return status, headers.get("location"), body
+
+    async def __send(self, connection, path, host):
+        reader, writer = connection
+        writer.write((
+            "GET " + path + " HTTP/1.1\r\n"
+            + "Host: " + host + "\r\n"
+            + "User-Agent: " + self.USER_AGENT + "\r\n"
+            + "Connection: keep-alive\r\n\r\n"
+        ).encode("latin-1"))
+        await writer.drain()
+
+        status_line = (await reader.readuntil(b"\r\n")).decode("latin-1").split(None, 2)
+        if len(status_line) < 2 or not status_line[0].startswith("HTTP/"):
+            raise ValueError("Invalid status line")
+        status = int(status_line[1])
+        headers = {}
+        while True:
+            line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        will_close = headers.get("connection", "").lower() == "close" or status_line[0] == "HTTP/1.0"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        elif status in [204, 304] or 100 <= status < 200:
+            body = b""
+        else:
+            body = await reader.read()
+            will_close = True
+        return status, headers, body, will_close
+
+    async def __new_connection(self, key):
+        scheme, hostname, port = key
+        if scheme == "https":
+            return await asyncio.open_connection(hostname, port if port else 443, ssl=True)
+        return await asyncio.open_connection(hostname, port if port else 80)
+
+    async def __acquire_connection(self, key):
+        connections = self.__idle_connections.get(key)
+        while connections:
+            connection = connections.pop()
+            if not connection[0].at_eof() and not connection[1].is_closing():
+                return connection, True
+            connection[1].close()
+        return await self.__new_connection(key), False
+
+    def __release_connection(self, key, connection):
+        connections = self.__idle_connections.setdefault(key, [])
+        if len(connections) < self.max_idle_per_host:
+            connections.append(connection)
+        else:
+            connection[1].close()
+
+    def close(self):
+        for connections in self.__idle_connections.values():
+            for connection in connections:
+                connection[1].close()
+        self.__idle_connections = {}
+
+    def get_stats(self):
+        return {
+            'requests': self.requests,
+            'reusedConnections': self.reused_connections,
+            'retriedRequests': self.retried_requests,
+            'idleConnections': sum(len(connections) for connections in self.__idle_connections.values())
+        }
+
+class AsyncCardImageDownloader():
+    # CardImageDownloaderのasyncio版
+    # カード一覧の読み込み(SQLite/mtgsdk)はCardImageDownloaderに任せてスレッドで実行し、画像のダウンロードは1スレッドで並行して行う
+    #   fetch_workers: 同時にダウンロードするカード数
+    #   queue_size: パイプラインの各段の間のキューの長さ（先読みしすぎてメモリを使わないよう制限する）
+
+    def __init__(self, downloader, http_client=None, fetch_workers=16, queue_size=64):
+        self.downloader = downloader
+        self.http_client = http_client if http_client else AsyncHTTPClient(max_connections=fetch_workers, max_idle_per_host=fetch_workers)
+        self.fetch_workers = fetch_workers
+        self.queue_size = queue_size
+        self.__set_card_indexes = {}
+        # 実行中のカード一覧の読み込みとカード画像のダウンロード {セット略号: Future}, {(セット略号, コレクター番号, 言語): Future}
+        self.__set_card_index_futures = {}
+        self.__image_futures = {}
+
+    async def get_set_card_index(self, set):
+        if set in self.__set_card_indexes:
+            return self.__set_card_indexes[set]
+        index = await self.__single_flight(self.__set_card_index_futures, set, asyncio.to_thread, self.downloader.get_set_card_index, set)
+        if index is not None:
+            self.__set_card_indexes[set] = index
+        return index
+
+    async def get_card(self, set, number):
+        index = await self.get_set_card_index(set)
+        if index:
+            return index.get(str(number))
+        return None
+
+    async def get_card_name_and_image_data(self, set, number, language=None):
+        card = await self.get_card(set, number)
+        if card:
+            return await self.download_card_name_and_image_data(set, card, language if language else self.downloader.get_language())
+        else:
+            return None, None
+
+    async def get_card_image_data(self, set, number, language=None):
+        _, image_data = await self.get_card_name_and_image_data(set, number, language)
+        return image_data
+
+    async def download_card_name_and_image_data(self, set, card, language):
+        name, image_data, _ = await self.download_card_name_image_data_and_failure_reason(set, card, language)
+        return name, image_data
+
+    async def download_card_name_image_data_and_failure_reason(self, set, card, language):
+        # 同じカード画像の同時ダウンロードは1回にまとめる
+        key = (set, card.get('number'), language)
+        return await self.__single_flight(self.__image_futures, key, self.__get_card_name_and_image_data, card, language)
+
+    async def __get_card_name_and_image_data(self, card, language):
+        reasons = []
+        for name, image_url in self.downloader.get_image_candidates(card, language):
+            image_data, reason = await self.__download_image_data_from_url(image_url, name)
+            if image_data:
+                return name, image_data, None
+            reasons.append(reason)
+        return card.get('name'), None, self.downloader.get_failure_reason(reasons)
+
+    async def __download_image_data_from_url(self, image_url, name=None):
+        try:
+            image_data = await self.http_client.get(image_url)
+        except HTTPClientError as e:
+            image_data = None
+
+        if self.downloader.is_card_back(image_data):
+            image_data, reason = None, ImageFailureReason.CARD_BACK
+        else:
+            reason = None if image_data else ImageFailureReason.HTTP_ERROR
+
+        self.downloader.print_download_result(image_url, image_data, name)
+        return image_data, reason
+
+    @classmethod
+    async def __single_flight(cls, futures, key, func, *args):
+        # 同じキーの処理が実行中であれば、その結果を待って共有する
+        future = futures.get(key)
+        if future is None:
+            future = futures[key] = asyncio.ensure_future(func(*args))
+            future.add_done_callback(lambda _: futures.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def save_card_images(self, requests, save, language=None, fail=None):
+        # カード画像を取得して保存するパイプライン
+        #   requests: (カード名, セット略号, コレクター番号)の列
+        #   save: save(カード名, セット略号, コレクター番号, 画像データ)で画像を保存し、保存先のパスを返す関数
+        #   fail: fail(カード名, セット略号, コレクター番号, 理由(ImageFailureReason))で取得できなかったことを記録する関数
+        # カードの特定 -> ダウンロード(カード裏面の検出を含む) -> 保存 の各段を長さqueue_sizeのキューでつなぎ、
+        # requestsの順に保存先のパス（取得できなければNone）を返す
+        language = language if language else self.downloader.get_language()
+        requests = list(requests)
+        paths = [None] * len(requests)
+        fetch_queue = asyncio.Queue(self.queue_size)
+        save_queue = asyncio.Queue(self.queue_size)
+
+        async def resolve():
+            for i, (name, set, number) in enumerate(requests):
+                index = await self.get_set_card_index(set)
+                card = index.get(str(number)) if index is not None else None
+                if card:
+                    await fetch_queue.put((i, name, set, number, card))
+                elif fail:
+                    # カード一覧を取得できなかった場合は、カードがないとは記録しない
+                    reason = ImageFailureReason.NOT_FOUND if index is not None else ImageFailureReason.HTTP_ERROR
+                    await save_queue.put((i, name, set, number, None, reason))
+            for _ in range(self.fetch_workers):
+                await fetch_queue.put(None)
+
+        async def fetch():
+            while True:
+                item = await fetch_queue.get()
+                if item is None:
+                    break
+                i, name, set, number, card = item
+                _, image_data, reason = await self.download_card_name_image_data_and_failure_reason(set, card, language)
+                if image_data or fail:
+                    await save_queue.put((i, name, set, number, image_data, reason))
+
+        async def write():
+            while True:
+                item = await save_queue.get()
+                if item is None:
+                    break
+                i, name, set, number, image_data, reason = item
+                try:
+                    if image_data:
+                        paths[i] = await asyncio.to_thread(save, name, set, number, image_data)
+                    else:
+                        await asyncio.to_thread(fail, name, set, number, reason)
+                except Exception as e:
+                    # 保存できなかったカードはNoneのまま、残りのカードの保存を続ける
+                    print("カード画像の保存に失敗: " + str(set) + " " + str(number), flush=True)
+                    print(e.args, flush=True)
+
+        tasks = [asyncio.ensure_future(resolve())] + [asyncio.ensure_future(fetch()) for _ in range(self.fetch_workers)]
+        writer = asyncio.ensure_future(write())
+        producers = asyncio.gather(*tasks)
+        try:
+            # 保存の段が止まると前の段がキューへの追加で待ち続けるため、先に終わった（例外）時点で全体を止める
+            await asyncio.wait([producers, writer], return_when=asyncio.FIRST_COMPLETED)
+            if not producers.done():
+                writer.result()
+            await producers
+            await save_queue.put(None)
+            await writer
+        finally:
+            # どの段で失敗しても、キューで待ったままのタスクを残さない
+            for task in tasks + [writer]:
+                task.cancel()
+            await asyncio.gather(*tasks, writer, producers, return_exceptions=True)
+        return paths
+
+    def close(self):
+        self.http_client.close()
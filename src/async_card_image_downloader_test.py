@@ -0,0 +1,89 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from types import SimpleNamespace
+import asyncio
+import unittest
+from async_card_image_downloader import AsyncCardImageDownloader
+from card_image_downloader import ImageFailureReason
+
+# カード画像の取得・保存パイプライン(save_card_images)を、カード一覧とHTTPクライアントの代わりを使って確認する
+#   python -m unittest async_card_image_downloader_test
+SET = "AAA"
+CARD_NUM = 50
+MISSING_NUMBER = 999
+
+class StandInHTTPClient():
+
+    async def get(self, url):
+        await asyncio.sleep(0)
+        return url.encode("utf-8")
+
+    def close(self):
+        pass
+
+def create_downloader():
+    index = {str(number): {'name': "Card" + str(number), 'number': str(number)} for number in range(1, CARD_NUM + 1)}
+    return SimpleNamespace(
+        get_language=lambda: "Japanese",
+        get_set_card_index=lambda set: index if set == SET else None,
+        get_image_candidates=lambda card, language: [(card['name'], "http://images.invalid/" + card['number'])],
+        is_card_back=lambda image_data: False,
+        print_download_result=lambda image_url, image_data, name: None,
+        get_failure_reason=lambda reasons: reasons[-1] if reasons else ImageFailureReason.NO_URL
+    )
+
+class AsyncCardImageDownloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.downloader = AsyncCardImageDownloader(create_downloader(), http_client=StandInHTTPClient(), fetch_workers=2, queue_size=2)
+
+    def save_card_images(self, requests, save, fail=None):
+        async def run():
+            # 保存の失敗で止まらないことを確認するため、時間内に終わらなければ失敗とする
+            return await asyncio.wait_for(self.downloader.save_card_images(requests, save, fail=fail), 10)
+        with redirect_stdout(StringIO()):
+            return asyncio.run(run())
+
+    def test_saves_in_request_order(self):
+        requests = [("Card" + str(number), SET, number) for number in range(CARD_NUM, 0, -1)]
+        paths = self.save_card_images(requests, lambda name, set, number, image_data: set + "/" + str(number))
+        self.assertEqual(paths, [SET + "/" + str(number) for number in range(CARD_NUM, 0, -1)])
+
+    def test_records_failures(self):
+        failures = []
+        requests = [("Card1", SET, 1), ("Unknown", SET, MISSING_NUMBER), ("Unknown", "ZZZ", 1)]
+        paths = self.save_card_images(requests, lambda *args: "saved", lambda name, set, number, reason: failures.append((set, number, reason)))
+        self.assertEqual(paths, ["saved", None, None])
+        # カード一覧を取得できないセットは、カードがないとは記録しない
+        self.assertEqual(sorted(failures), [(SET, MISSING_NUMBER, ImageFailureReason.NOT_FOUND), ("ZZZ", 1, ImageFailureReason.HTTP_ERROR)])
+
+    def test_continues_after_save_error(self):
+        def save(name, set, number, image_data):
+            if number == 3:
+                raise OSError("No space left on device")
+            return set + "/" + str(number)
+
+        def fail(name, set, number, reason):
+            raise RuntimeError("database is locked")
+
+        requests = [("Card" + str(number), SET, number) for number in range(1, CARD_NUM + 1)] + [("Unknown", SET, MISSING_NUMBER)]
+        paths = self.save_card_images(requests, save, fail)
+        expected = [None if number == 3 else SET + "/" + str(number) for number in range(1, CARD_NUM + 1)] + [None]
+        self.assertEqual(paths, expected)
+
+    def test_stops_all_stages_on_fetch_error(self):
+        async def get(url):
+            raise ValueError("unexpected")
+        self.downloader.http_client.get = get
+
+        async def run():
+            with self.assertRaises(ValueError):
+                requests = [("Card" + str(number), SET, number) for number in range(1, CARD_NUM + 1)]
+                await asyncio.wait_for(self.downloader.save_card_images(requests, lambda *args: None), 10)
+            # 失敗した後に待ったままのタスクが残っていない
+            self.assertEqual([task for task in asyncio.all_tasks() if task is not asyncio.current_task()], [])
+        with redirect_stdout(StringIO()):
+            asyncio.run(run())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+from hashlib import sha1
+from importlib.metadata import PackageNotFoundError, version
+from os import environ, listdir, makedirs, stat
+from os.path import dirname, exists, expanduser, join
+import pickle
+import sys
+from single_flight import write_file_atomically
+
+class CardCatalog():
+
+    SNAPSHOT_FORMAT = 3
+
+    def __init__(self, cards):
+        self.cards = cards
+        self.build_index()
+        self.build_set_info()
+
+    def build_index(self):
+        # 検索キー毎にカードの位置(self.cards内のインデックス)の集合を作る
+        self.__flags = {}           # (collectible, is_token, is_secondary_card, is_rebalanced)
+        self.__sets = {}            # set
+        self.__rarities = {}        # rarity
+        self.__pretty_names = {}    # pretty_name
+        self.__set_numbers = {}     # (set, set_number)
+        self.__mtga_ids = {}        # mtga_id
+        self.__names = {}           # (pretty_name, is_rebalanced, set, set_number) / (pretty_name, is_rebalanced) -> カード
+        for i, card in enumerate(self.cards):
+            self.__add_index(self.__flags, (card.collectible, card.is_token, card.is_secondary_card, card.is_rebalanced), i)
+            self.__add_index(self.__sets, card.set, i)
+            self.__add_index(self.__rarities, card.rarity, i)
+            self.__add_index(self.__pretty_names, card.pretty_name, i)
+            self.__add_index(self.__set_numbers, (card.set, card.set_number), i)
+            self.__add_index(self.__mtga_ids, card.mtga_id, i)
+            if card.collectible and not card.is_token and not card.is_secondary_card:
+                # 同じキーのカードが複数あればget_cardsの結果の最後のカードを使う
+                self.__names[(card.pretty_name, card.is_rebalanced, card.set, card.set_number)] = card
+                self.__names[(card.pretty_name, card.is_rebalanced)] = card
+
+    def build_set_info(self):
+        # セット毎・レアリティ毎のカード一覧と枚数
+        self.sets = self.get_sets()
+        buckets = {}
+        for card in self.get_cards():
+            if card.set:
+                if (card.set, card.rarity) in buckets:
+                    buckets[(card.set, card.rarity)].append(card)
+                else:
+                    buckets[(card.set, card.rarity)] = [card]
+        self.__buckets = {}
+        self.set_info = {}
+        for set in self.sets:
+            self.set_info[set] = {}
+        for key in buckets.keys():
+            self.__buckets[key] = tuple(buckets[key])
+            self.set_info[key[0]][key[1]] = len(buckets[key])
+
+    @classmethod
+    def __add_index(cls, index, key, i):
+        if key in index:
+            index[key].add(i)
+        else:
+            index[key] = {i}
+
+    def get_cards(self, name="", pretty_name="", cost=None, color_identity=None, card_type="", sub_type="", super_type="",
+                    ability="", set="", rarity="", collectible=True, set_number=0, mtga_id=0,
+                    is_token=False, is_secondary_card=False, is_rebalanced=False):
+        # インデックスのある条件で候補を絞り込む
+        candidates = [self.__flags.get((collectible, is_token, is_secondary_card, is_rebalanced), ())]
+        if set and set_number:
+            candidates.append(self.__set_numbers.get((set, set_number), ()))
+        elif set:
+            candidates.append(self.__sets.get(set, ()))
+        if rarity:
+            candidates.append(self.__rarities.get(rarity, ()))
+        if pretty_name:
+            candidates.append(self.__pretty_names.get(pretty_name, ()))
+        if mtga_id:
+            candidates.append(self.__mtga_ids.get(mtga_id, ()))
+        candidates.sort(key=len)
+        positions = frozenset(candidates[0]).intersection(*candidates[1:])
+
+        # インデックスのない条件は候補に対してのみ判定する
+        cards = []
+        for i in sorted(positions):
+            card = self.cards[i]
+            if name and card.name != name:
+                continue
+            if cost and card.cost != cost:
+                continue
+            if color_identity and card.color_identity != color_identity:
+                continue
+            if card_type and card.card_type != card_type:
+                continue
+            if sub_type and not sub_type in card.sub_types:
+                continue
+            if super_type and not super_type in card.super_type:
+                continue
+            if ability and not ability in card.abilities:
+                continue
+            if set_number and card.set_number != set_number:
+                continue
+            cards.append(card)
+        return cards
+
+    def get_card(self, mtga_id):
+        positions = self.__mtga_ids.get(mtga_id)
+        if not positions:
+            return None
+        return self.cards[min(positions)]
+
+    def resolve(self, pretty_name, is_rebalanced=False, set="", set_number=0):
+        # get_cards(pretty_name=pretty_name, set=set, set_number=set_number, is_rebalanced=is_rebalanced)[-1]と同じカードを返す
+        if set and set_number:
+            return self.__names.get((pretty_name, is_rebalanced, set, set_number))
+        elif not set and not set_number:
+            return self.__names.get((pretty_name, is_rebalanced))
+        cards = self.get_cards(pretty_name=pretty_name, set=set, set_number=set_number, is_rebalanced=is_rebalanced)
+        return cards[-1] if cards else None
+
+    def get_bucket(self, set, rarity):
+        # get_cards(set=set, rarity=rarity)と同じカードを同じ順序で返す
+        return self.__buckets.get((set, rarity), ())
+
+    def get_sets(self):
+        sets = {}
+        for card in self.get_cards():
+            if card.set:
+                sets[card.set] = None
+        return list(sets.keys())
+
+    @classmethod
+    def get_snapshot_key(cls):
+        # スナップショットはmtgaパッケージのバージョンとMTGAのカードデータ毎に作り直す
+        try:
+            mtga_version = version('mtga')
+        except PackageNotFoundError:
+            return None
+        return str(cls.SNAPSHOT_FORMAT) + "@" + mtga_version + "@" + cls.get_mtga_data_fingerprint()
+
+    @classmethod
+    def get_mtga_data_location(cls):
+        # mtga.set_data.dynamicと同じ場所（インポートするとカードデータを全て読み込むため、ここで求める）
+        if sys.platform == "darwin":
+            return join(expanduser("~"), "Library/Application Support/com.wizards.mtga/Downloads/Data")
+        elif sys.platform == "win32":
+            try:
+                from winreg import ConnectRegistry, OpenKey, HKEY_LOCAL_MACHINE, QueryValueEx
+                registry_key = OpenKey(ConnectRegistry(None, HKEY_LOCAL_MACHINE), r"SOFTWARE\Wizards of the Coast\MTGArena")
+                return QueryValueEx(registry_key, "Path")[0] + r"MTGA_Data\Downloads\Data"
+            except Exception:
+                return join(environ.get("ProgramFiles", r"C:\Program Files"), "Wizards of the Coast", "MTGA", "MTGA_Data", "Downloads", "Data")
+        return None
+
+    @classmethod
+    def get_mtga_data_fingerprint(cls):
+        # MTGAのカードデータ・ローカライズ等のファイルの名前、サイズ、更新日時のハッシュ値（新セットの追加で変わる）
+        location = cls.get_mtga_data_location()
+        if not location or not exists(location):
+            return ""
+        entries = []
+        for file_name in sorted(listdir(location)):
+            file_split = file_name.split("_")
+            if len(file_split) > 1 and file_split[1] in ["enums", "cards", "abilities", "loc"] and file_name.endswith("mtga"):
+                file_stat = stat(join(location, file_name))
+                entries.append(file_name + ":" + str(file_stat.st_size) + ":" + str(file_stat.st_mtime_ns))
+        return sha1("\n".join(entries).encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def load_snapshot(cls, path, key):
+        if not key or not exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            print("カード一覧スナップショットの読み込みに失敗", flush=True)
+            print(e.args, flush=True)
+            return None
+        if snapshot.get('key') != key:
+            return None
+        return snapshot.get('catalog')
+
+    def save_snapshot(self, path, key):
+        if not key:
+            return False
+        try:
+            if dirname(path) and not exists(dirname(path)):
+                makedirs(dirname(path))
+            # 同時に作り直す他のプロセスと一時ファイルが重ならないようにする
+            write_file_atomically(path, pickle.dumps({'key': key, 'catalog': self}, protocol=pickle.HIGHEST_PROTOCOL))
+            return True
+        except Exception as e:
+            print("カード一覧スナップショットの保存に失敗", flush=True)
+            print(e.args, flush=True)
+            return False
+
+    @classmethod
+    def load_all_mtga_cards(cls, snapshot_path=None):
+        # スナップショットがあればそれを使い、なければmtgaのカード一覧からインデックスを作って保存する
+        key = cls.get_snapshot_key()
+        if snapshot_path:
+            catalog = cls.load_snapshot(snapshot_path, key)
+            if catalog:
+                return catalog
+        from mtga.set_data import all_mtga_cards
+        catalog = cls(all_mtga_cards.cards)
+        if snapshot_path:
+            catalog.save_snapshot(snapshot_path, key)
+        return catalog
@@ -0,0 +1,501 @@
+from collections import namedtuple
+from hashlib import sha256
+from io import BytesIO
+from os import listdir, makedirs, remove, walk
+from os.path import exists, getsize, isfile, join, splitext
+from threading import Lock
+from time import time
+import json
+import sqlite3
+from PIL import Image
+from single_flight import write_file_atomically
+
+# path: 画像ファイルのパス, format: PILの画像形式, width/height: 画像の大きさ, digest: 画像データのSHA-256, name: カード名
+# tile_path: 描画用に変換した画像(RGBA生データ)のパス
+CardImageEntry = namedtuple('CardImageEntry', ['path', 'format', 'width', 'height', 'digest', 'name', 'tile_path'])
+
+class CardImageCache():
+    # カード画像を内容のハッシュ値をファイル名として保存し、(セット略号, コレクター番号, 言語)から画像への索引をSQLiteで持つ
+    #   dir/card_image_cache.sqlite3: 索引
+    #   dir/blobs/<ハッシュ値の先頭2文字>/<ハッシュ値>.<拡張子>: 画像
+    #   dir/tiles/<ハッシュ値の先頭2文字>/<ハッシュ値>_<幅>x<高さ>.rgba: tile_sizeにリサイズしたRGBAの生データ（描画時にデコード・リサイズしない）
+    # 同じ画像（再録カードや言語が違っても英語画像になるカード等）は1ファイルにまとめる
+    # max_bytesを指定すると、画像の合計サイズが上限を超えたときに、ピン留めしたセット以外の画像をpolicyに従って削除する
+    #   lru: 最後に使われた日時が古い画像から削除, lfu: 使われた回数が少ない画像から削除
+    # 取得できなかったカード画像も理由毎の有効期限(failure_ttls)の間は記録し、再ダウンロードしない
+    INDEX_FILE_NAME = "card_image_cache.sqlite3"
+    BLOB_DIR_NAME = "blobs"
+    TILE_DIR_NAME = "tiles"
+    POLICIES = ['lru', 'lfu']
+    EVICTION_TARGET_RATE = 0.9  # 削除するときは上限のこの割合まで減らす（保存の度に削除しないように）
+    ACCESS_FLUSH_SIZE = 64  # 使用履歴はこの件数か
+    ACCESS_FLUSH_INTERVAL = 30  # この秒数ごとにまとめて索引に書き込む
+    # 取得できなかった理由毎の再試行までの秒数
+    FAILURE_TTLS = {
+        'card_back': 7 * 24 * 3600,   # 画像が用意されるまで時間がかかる
+        'no_url': 7 * 24 * 3600,
+        'not_found': 24 * 3600,
+        'http_error': 3600            # 一時的なエラーの可能性が高い
+    }
+    DEFAULT_FAILURE_TTL = 3600
+    FORMATS = {
+        'PNG': '.png',
+        'JPEG': '.jpg',
+        'GIF': '.gif',
+        'BMP': '.bmp',
+        'DIB': '.dib',
+        'TIFF': '.tiff',
+        'PPM': '.ppm'
+    }
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            format TEXT,
+            width INTEGER,
+            height INTEGER,
+            size INTEGER
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS images (
+            set_code TEXT NOT NULL,
+            number TEXT NOT NULL,
+            language TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            name TEXT,
+            last_access REAL NOT NULL DEFAULT 0,
+            access_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (set_code, number, language)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS images_digest ON images (digest);
+        CREATE TABLE IF NOT EXISTS failures (
+            set_code TEXT NOT NULL,
+            number TEXT NOT NULL,
+            language TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            failed_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (set_code, number, language)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, dir, tile_size=None, max_bytes=None, policy='lru', failure_ttls=None):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown eviction policy: " + str(policy))
+        self.dir = dir
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.failure_ttls = dict(self.FAILURE_TTLS, **(failure_ttls if failure_ttls else {}))
+        self.__connection = None
+        self.__lock = Lock()
+        # 索引に書き込んでいない使用履歴 {(セット略号, コレクター番号, 言語): (最終使用日時, 使用回数)}
+        self.__accesses = {}
+        self.__accesses_flushed = time()
+        self.evictions = 0
+
+    def __get_connection(self):
+        if self.__connection is None:
+            makedirs(self.dir, exist_ok=True)
+            self.__connection = sqlite3.connect(join(self.dir, self.INDEX_FILE_NAME), check_same_thread=False)
+            self.__upgrade_schema(self.__connection)
+            self.__connection.executescript(self.SCHEMA)
+        return self.__connection
+
+    @classmethod
+    def __upgrade_schema(cls, connection):
+        # 使用履歴の列がない索引に列を追加する
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(images)")]
+        if columns and 'last_access' not in columns:
+            with connection:
+                connection.execute("ALTER TABLE images ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+                connection.execute("ALTER TABLE images ADD COLUMN access_count INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        with self.__lock:
+            if self.__connection:
+                self.__flush_accesses()
+                self.__connection.close()
+                self.__connection = None
+
+    def get_blob_path(self, digest, format):
+        return join(self.dir, self.BLOB_DIR_NAME, digest[:2], digest + self.FORMATS.get(format, ''))
+
+    def get_tile_path(self, digest):
+        if self.tile_size is None:
+            return None
+        return join(self.dir, self.TILE_DIR_NAME, digest[:2], digest + "_" + str(self.tile_size[0]) + "x" + str(self.tile_size[1]) + ".rgba")
+
+    def save_tile(self, digest, image):
+        # 画像をRGBAに変換してtile_sizeにリサイズし、生データで保存する
+        image = image.convert('RGBA')
+        if image.size != self.tile_size:
+            image = image.resize(self.tile_size)
+        makedirs(join(self.dir, self.TILE_DIR_NAME, digest[:2]), exist_ok=True)
+        write_file_atomically(self.get_tile_path(digest), image.tobytes())
+        return image
+
+    def open_tile(self, entry):
+        # 描画用の画像を返す。変換前に保存された画像は、ここで変換して保存する
+        try:
+            with open(entry.tile_path, 'rb') as f:
+                return Image.frombytes('RGBA', self.tile_size, f.read())
+        except (OSError, ValueError):
+            with Image.open(entry.path) as image:
+                return self.save_tile(entry.digest, image)
+
+    def get(self, set, number, language):
+        # 索引の1回の検索で画像を引く。なければNone
+        with self.__lock:
+            row = self.__get_connection().execute(
+                "SELECT blobs.digest, blobs.format, blobs.width, blobs.height, images.name"
+                + " FROM images JOIN blobs ON images.digest = blobs.digest"
+                + " WHERE images.set_code = ? AND images.number = ? AND images.language = ?",
+                (set, str(number), language)
+            ).fetchone()
+            if row is not None:
+                self.__record_access((set, str(number), language))
+        if row is None:
+            return None
+        digest, format, width, height, name = row
+        return CardImageEntry(self.get_blob_path(digest, format), format, width, height, digest, name, self.get_tile_path(digest))
+
+    def record_access(self, set, number, language):
+        # 索引を引かずに使った画像（メモリ上の描画用画像等）の使用を記録する
+        with self.__lock:
+            self.__record_access((set, str(number), language))
+
+    def __record_access(self, key):
+        # 使用履歴は読み込みの度に書き込まず、まとめて書き込む（self.__lockを取得して呼ぶ）
+        now = time()
+        _, count = self.__accesses.get(key, (0, 0))
+        self.__accesses[key] = (now, count + 1)
+        if len(self.__accesses) >= self.ACCESS_FLUSH_SIZE or now - self.__accesses_flushed >= self.ACCESS_FLUSH_INTERVAL:
+            self.__flush_accesses()
+
+    def __flush_accesses(self):
+        # self.__lockを取得して呼ぶ
+        if self.__accesses:
+            connection = self.__get_connection()
+            with connection:
+                connection.executemany(
+                    "UPDATE images SET last_access = MAX(last_access, ?), access_count = access_count + ?"
+                    + " WHERE set_code = ? AND number = ? AND language = ?",
+                    [(last_access, count) + key for key, (last_access, count) in self.__accesses.items()]
+                )
+            self.__accesses = {}
+        self.__accesses_flushed = time()
+
+    def put(self, set, number, language, name, image_data):
+        # 画像を保存して索引に登録する。画像として読めないデータはValueError
+        digest = sha256(image_data).hexdigest()
+        try:
+            image = Image.open(BytesIO(image_data))
+            image.load()
+        except Exception as e:
+            raise ValueError("Not an image: " + repr(e))
+        with image:
+            format, width, height = image.format, image.width, image.height
+            # 保存時に描画用の画像も作っておく
+            if self.tile_size and not exists(self.get_tile_path(digest)):
+                self.save_tile(digest, image)
+        path = self.get_blob_path(digest, format)
+        if not exists(path):
+            makedirs(join(self.dir, self.BLOB_DIR_NAME, digest[:2]), exist_ok=True)
+            write_file_atomically(path, image_data)
+        with self.__lock:
+            connection = self.__get_connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO blobs (digest, format, width, height, size) VALUES (?, ?, ?, ?, ?)",
+                    (digest, format, width, height, len(image_data))
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO images (set_code, number, language, digest, name, last_access, access_count)"
+                    + " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                    (set, str(number), language, digest, name, time())
+                )
+                connection.execute(
+                    "DELETE FROM failures WHERE set_code = ? AND number = ? AND language = ?", (set, str(number), language)
+                )
+        if self.max_bytes is not None and self.get_total_bytes() > self.max_bytes:
+            self.evict(keep_digests=[digest])
+        return CardImageEntry(path, format, width, height, digest, name, self.get_tile_path(digest))
+
+    def remove(self, set, number, language):
+        # 索引から外す（画像ファイルは他の索引から参照されている可能性があるため残す）
+        with self.__lock:
+            connection = self.__get_connection()
+            with connection:
+                connection.execute(
+                    "DELETE FROM images WHERE set_code = ? AND number = ? AND language = ?", (set, str(number), language)
+                )
+
+    def get_failure(self, set, number, language):
+        # 有効期限内の取得できなかった記録を(理由, 有効期限のUNIX時間)で返す。なければNone
+        with self.__lock:
+            row = self.__get_connection().execute(
+                "SELECT reason, expires_at FROM failures WHERE set_code = ? AND number = ? AND language = ? AND expires_at > ?",
+                (set, str(number), language, time())
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put_failure(self, set, number, language, reason):
+        # 取得できなかったことを記録する。有効期限は理由毎のTTL
+        now = time()
+        with self.__lock:
+            connection = self.__get_connection()
+            with connection:
+                connection.execute(
+                    "INSERT INTO failures (set_code, number, language, reason, failed_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)"
+                    + " ON CONFLICT (set_code, number, language) DO UPDATE SET"
+                    + " reason = excluded.reason, failed_at = excluded.failed_at, expires_at = excluded.expires_at, attempts = attempts + 1",
+                    (set, str(number), language, reason, now, now + self.failure_ttls.get(reason, self.DEFAULT_FAILURE_TTL))
+                )
+
+    def clear_failures(self, set=None, number=None, language=None, reason=None):
+        # 取得できなかった記録を消して、次回は再ダウンロードさせる（Noneの条件は全て）。消した件数を返す
+        conditions = []
+        params = []
+        for column, value in [("set_code", set), ("number", number), ("language", language), ("reason", reason)]:
+            if value is not None:
+                conditions.append(column + " = ?")
+                params.append(str(value))
+        with self.__lock:
+            connection = self.__get_connection()
+            with connection:
+                return connection.execute(
+                    "DELETE FROM failures" + (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+                ).rowcount
+
+    def get_tile_bytes(self):
+        # 描画用の画像1枚のサイズ（RGBAの生データ）
+        return self.tile_size[0] * self.tile_size[1] * 4 if self.tile_size else 0
+
+    def get_total_bytes(self):
+        # 索引にある画像（描画用の画像を含む）の合計サイズ
+        with self.__lock:
+            count, size = self.__get_connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return size + count * self.get_tile_bytes()
+
+    def get_pinned_sets(self):
+        return json.loads(self.get_meta('pinnedSets', '[]'))
+
+    def set_pinned_sets(self, sets):
+        # ピン留めしたセットの画像は削除しない（同じ画像を使う他のセットの版も残る）
+        self.set_meta('pinnedSets', json.dumps(sorted(set(sets))))
+
+    def __get_eviction_candidates(self, pinned_sets):
+        # ピン留めしたセットから参照されていない画像を、削除する順に(ハッシュ値, 形式, サイズ, 参照数)で返す
+        # どこからも参照されていない画像が先頭（self.__lockを取得して呼ぶ）
+        placeholders = ", ".join("?" for _ in pinned_sets)
+        pinned = "SUM(CASE WHEN images.set_code IN (" + placeholders + ") THEN 1 ELSE 0 END)" if pinned_sets else "0"
+        order = "MAX(images.last_access)" if self.policy == 'lru' else "SUM(images.access_count), MAX(images.last_access)"
+        return self.__get_connection().execute(
+            "SELECT blobs.digest, blobs.format, blobs.size, COUNT(images.digest)"
+            + " FROM blobs LEFT JOIN images ON images.digest = blobs.digest"
+            + " GROUP BY blobs.digest HAVING " + pinned + " = 0"
+            + " ORDER BY COUNT(images.digest) > 0, " + order,
+            list(pinned_sets)
+        ).fetchall()
+
+    def evict(self, max_bytes=None, dry_run=False, keep_digests=()):
+        # 画像の合計サイズがmax_bytes（省略時はself.max_bytes）を超えていれば、上限のEVICTION_TARGET_RATEまで削除する
+        # どこからも参照されていない画像は常に削除する。keep_digestsの画像は削除しない
+        # 削除した（dry_runでは削除する）画像の[(ハッシュ値, サイズ)]を返す
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        pinned_sets = self.get_pinned_sets()
+        tile_bytes = self.get_tile_bytes()
+        total_bytes = self.get_total_bytes()
+        if max_bytes is None or total_bytes <= max_bytes:
+            target_bytes = total_bytes
+        else:
+            target_bytes = int(max_bytes * self.EVICTION_TARGET_RATE)
+        evicted = []
+        with self.__lock:
+            self.__flush_accesses()
+            for digest, format, size, references in self.__get_eviction_candidates(pinned_sets):
+                if references > 0 and total_bytes <= target_bytes:
+                    break
+                if digest in keep_digests:
+                    continue
+                evicted.append((digest, format, size + tile_bytes))
+                total_bytes -= size + tile_bytes
+            if not dry_run and evicted:
+                connection = self.__get_connection()
+                with connection:
+                    connection.executemany("DELETE FROM images WHERE digest = ?", [(digest,) for digest, _, _ in evicted])
+                    connection.executemany("DELETE FROM blobs WHERE digest = ?", [(digest,) for digest, _, _ in evicted])
+                self.evictions += len(evicted)
+        if not dry_run:
+            for digest, format, _ in evicted:
+                for path in [self.get_blob_path(digest, format), self.get_tile_path(digest)]:
+                    if path and exists(path):
+                        remove(path)
+        return [(digest, size) for digest, _, size in evicted]
+
+    def get_untracked_files(self):
+        # 索引にない画像ファイル（削除済みの画像の描画用画像や、書き込み途中で中断した一時ファイル等）
+        with self.__lock:
+            digests = set(row[0] for row in self.__get_connection().execute("SELECT digest FROM blobs"))
+        untracked = []
+        for dir_name in [self.BLOB_DIR_NAME, self.TILE_DIR_NAME]:
+            for root, _, file_names in walk(join(self.dir, dir_name)):
+                for file_name in file_names:
+                    is_tmp = file_name.endswith('.tmp')
+                    digest = file_name.split('.')[0].split('_')[0]
+                    if is_tmp or digest not in digests:
+                        untracked.append(join(root, file_name))
+        return untracked
+
+    def remove_untracked_files(self):
+        removed_bytes = 0
+        for path in self.get_untracked_files():
+            removed_bytes += getsize(path)
+            remove(path)
+        return removed_bytes
+
+    def get_usage_report(self):
+        # キャッシュの使用量: 合計サイズ、セット毎の使用量（複数のセットで同じ画像は各セットに数える）、削除できるサイズ
+        pinned_sets = self.get_pinned_sets()
+        tile_bytes = self.get_tile_bytes()
+        with self.__lock:
+            self.__flush_accesses()
+            rows = self.__get_connection().execute(
+                "SELECT set_code, COUNT(*), SUM(size), MAX(last_access), SUM(access_count) FROM ("
+                + " SELECT images.set_code, blobs.digest, blobs.size,"
+                + " MAX(images.last_access) AS last_access, SUM(images.access_count) AS access_count"
+                + " FROM images JOIN blobs ON images.digest = blobs.digest"
+                + " GROUP BY images.set_code, blobs.digest"
+                + ") GROUP BY set_code ORDER BY SUM(size) DESC"
+            ).fetchall()
+            image_count = self.__get_connection().execute("SELECT COUNT(*) FROM images").fetchone()[0]
+            failures = dict(self.__get_connection().execute(
+                "SELECT reason, COUNT(*) FROM failures WHERE expires_at > ? GROUP BY reason", (time(),)
+            ).fetchall())
+            evictable = self.__get_eviction_candidates(pinned_sets)
+        untracked_bytes = sum(getsize(path) for path in self.get_untracked_files())
+        return {
+            "dir": self.dir,
+            "totalBytes": self.get_total_bytes(),
+            "maxBytes": self.max_bytes,
+            "policy": self.policy,
+            "images": image_count,
+            "pinnedSets": pinned_sets,
+            "sets": [
+                {
+                    "set": set,
+                    "blobs": count,
+                    "bytes": size + count * tile_bytes,
+                    "lastAccess": last_access,
+                    "accessCount": access_count,
+                    "pinned": set in pinned_sets
+                }
+                for set, count, size, last_access, access_count in rows
+            ],
+            "evictableBytes": sum(size + tile_bytes for _, _, size, _ in evictable),
+            "reclaimableBytes": sum(size for _, size in self.evict(dry_run=True)) + untracked_bytes,
+            "untrackedBytes": untracked_bytes,
+            "failures": failures,
+            "evictions": self.evictions
+        }
+
+    def get_meta(self, key, default=None):
+        with self.__lock:
+            row = self.__get_connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.__lock:
+            connection = self.__get_connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_migrated(self):
+        return self.get_meta('migrated') is not None
+
+    def migrate_name_keyed_images(self, resolve_name, language):
+        # 旧形式（dir/<カード名>.<拡張子>）の画像を取り込む
+        #   resolve_name: カード名 -> そのカード名の(セット略号, コレクター番号)のリスト
+        # 旧形式の画像はカード名が同じ版のどれの画像か分からないため、版が1つに決まるカード名の画像のみ取り込む
+        # （複数の版があるカード名は取り込まず、版毎に改めてダウンロードする）
+        imported = []
+        for file_name in sorted(listdir(self.dir)) if exists(self.dir) else []:
+            path = join(self.dir, file_name)
+            if not isfile(path):
+                continue
+            name, ext = splitext(file_name)
+            if ext.lower() not in self.FORMATS.values():
+                continue
+            with open(path, 'rb') as f:
+                image_data = f.read()
+            printings = resolve_name(name)
+            if len(printings) != 1:
+                continue
+            set, number = printings[0]
+            if self.get(set, number, language) is None:
+                try:
+                    self.put(set, number, language, name, image_data)
+                except ValueError:
+                    continue
+                imported.append((set, number))
+        self.set_meta('migrated', '1')
+        return imported
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="カード画像キャッシュの保守")
+    parser.add_argument("--dir", default="card_image")
+    parser.add_argument("--max-mb", type=int, help="キャッシュの上限(MB)")
+    parser.add_argument("--policy", default="lru", choices=CardImageCache.POLICIES)
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("migrate", help="カード名で保存したカード画像を新形式の索引に取り込む（省略時）")
+    report_parser = subparsers.add_parser("report", help="使用量、セット毎の使用量、削除できるサイズを表示する")
+    report_parser.add_argument("--json", action="store_true")
+    subparsers.add_parser("evict", help="上限を超えた分と、どこからも参照されていない画像を削除する")
+    pin_parser = subparsers.add_parser("pin", help="削除しないセットを指定する（指定なしで解除）")
+    pin_parser.add_argument("sets", nargs="*")
+    refresh_parser = subparsers.add_parser("refresh", help="取得できなかった記録を消して、次回は再ダウンロードさせる")
+    refresh_parser.add_argument("--set")
+    refresh_parser.add_argument("--number")
+    refresh_parser.add_argument("--reason", choices=list(CardImageCache.FAILURE_TTLS.keys()))
+    args = parser.parse_args()
+
+    max_bytes = args.max_mb * 1024 * 1024 if args.max_mb is not None else None
+    if args.command == "report":
+        from generator import CardImage
+        cache = CardImageCache(args.dir, (CardImage.WIDTH, CardImage.HEIGHT), max_bytes, args.policy)
+        report = cache.get_usage_report()
+        if args.json:
+            print(json.dumps(report, indent=4, ensure_ascii=False))
+        else:
+            mb = lambda size: "{:.1f}MB".format(size / 1024 / 1024)
+            print("合計: " + mb(report["totalBytes"]) + (" / 上限: " + mb(max_bytes) if max_bytes is not None else "") + ", " + str(report["images"]) + "件")
+            print("ピン留め: " + (", ".join(report["pinnedSets"]) if report["pinnedSets"] else "なし"))
+            for set_usage in report["sets"]:
+                print("  " + set_usage["set"] + ": " + mb(set_usage["bytes"]) + ", " + str(set_usage["blobs"]) + "枚" + (" (ピン留め)" if set_usage["pinned"] else ""))
+            print("削除できるサイズ: " + mb(report["reclaimableBytes"]) + " (ピン留め以外: " + mb(report["evictableBytes"]) + ")")
+            print("取得できなかったカード画像: " + (", ".join(reason + " " + str(count) + "件" for reason, count in report["failures"].items()) if report["failures"] else "なし"))
+    elif args.command == "evict":
+        from generator import CardImage
+        cache = CardImageCache(args.dir, (CardImage.WIDTH, CardImage.HEIGHT), max_bytes, args.policy)
+        evicted = cache.evict()
+        removed_bytes = sum(size for _, size in evicted) + cache.remove_untracked_files()
+        print(str(len(evicted)) + "件のカード画像を削除しました (" + "{:.1f}MB".format(removed_bytes / 1024 / 1024) + ")", flush=True)
+    elif args.command == "pin":
+        cache = CardImageCache(args.dir)
+        cache.set_pinned_sets(args.sets)
+        print("ピン留め: " + (", ".join(cache.get_pinned_sets()) if args.sets else "なし"), flush=True)
+    elif args.command == "refresh":
+        cache = CardImageCache(args.dir)
+        count = cache.clear_failures(args.set, args.number, reason=args.reason)
+        print(str(count) + "件の取得できなかった記録を消しました", flush=True)
+    else:
+        from generator import Generator
+        generator = Generator(card_image_cache_dir=args.dir)
+        imported = generator.migrate_card_image_cache()
+        print(str(len(imported)) + "件のカード画像を取り込みました", flush=True)
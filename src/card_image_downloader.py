@@ -1,12 +1,19 @@
-from urllib.error import URLError
-from mtgsdk import Card
 from os.path import exists, join
-import json
-from urllib.request import urlopen
 from hashlib import md5
 from re import sub
 from PIL import Image
 from io import BytesIO
+from threading import Lock
+from set_data_store import SetDataStore
+from single_flight import SingleFlight, write_file_atomically
+from http_client import HTTPClient, HTTPClientError
+
+class ImageFailureReason():
+    # カード画像が取得できなかった理由
+    CARD_BACK = "card_back"     # カードの裏面画像が返ってきた（画像が用意されていない）
+    HTTP_ERROR = "http_error"   # 接続エラー、HTTPエラー、画像として読めないデータ、セットのカード一覧を取得できない
+    NO_URL = "no_url"           # カードデータに画像URLがない
+    NOT_FOUND = "not_found"     # セットのカード一覧にコレクター番号がない
 
 class CardImageDownloader():
     FORMATS = {
@@ -19,16 +26,53 @@ class CardImageDownloader():
         'PPM': '.ppm'
     }
 
-    def __init__(self, language='Japanese', json_dir='.'):
+    # セット毎のカード一覧とコレクター番号の索引はプロセス内で共有する {(json_dir, セット略号): (カード一覧, 索引)}
+    __set_cards_cache = {}
+    __set_cards_cache_lock = Lock()
+    __set_data_stores = {}
+    # 実行中のカード一覧の読み込みとカード画像のダウンロード {(json_dir, セット略号)}, {(セット略号, コレクター番号, 言語)}
+    __set_cards_flight = SingleFlight()
+    __image_flight = SingleFlight()
+
+    # http_clientを指定しないインスタンスで共有するHTTPクライアント
+    __default_http_client = None
+
+    def __init__(self, language='Japanese', json_dir='.', http_client=None):
         self.__language = language
         self.__json_dir = json_dir
+        self.__http_client = http_client
+
+    def get_language(self):
+        return self.__language
+
+    def get_http_client(self):
+        if self.__http_client is None:
+            with self.__set_cards_cache_lock:
+                if CardImageDownloader.__default_http_client is None:
+                    CardImageDownloader.__default_http_client = HTTPClient()
+                self.__http_client = CardImageDownloader.__default_http_client
+        return self.__http_client
 
     def get_card_name_and_image_data(self, set, number, language=None):
-        card = self.__get_card(set, number)
+        name, image_data, _ = self.get_card_name_image_data_and_failure_reason(set, number, language)
+        return name, image_data
+
+    def get_card_name_image_data_and_failure_reason(self, set, number, language=None):
+        # (カード名, 画像データ, 取得できなかった理由(ImageFailureReason))を返す
+        index = self.get_set_card_index(set)
+        if index is None:
+            # カード一覧を取得できなかった（一時的なエラーの可能性があるため、カードがないとは記録しない）
+            return None, None, ImageFailureReason.HTTP_ERROR
+        card = index.get(str(number))
         if card:
-            return self.__get_card_name_and_image_data(card, language if language else self.__language)
+            return self.__download_card_name_and_image_data(set, card, language if language else self.__language)
         else:
-            return None, None
+            return None, None, ImageFailureReason.NOT_FOUND
+
+    def __download_card_name_and_image_data(self, set, card, language):
+        # 同じカード画像の同時ダウンロードは1回にまとめる
+        key = (set, card.get('number'), language)
+        return self.__image_flight.do(key, self.__get_card_name_and_image_data, card, language)
     
     def get_card_image_data(self, set, number, language=None):
         _, image_data = self.get_card_name_and_image_data(set, number, language if language else self.__language)
@@ -46,66 +90,117 @@ class CardImageDownloader():
                     is_exist = True
                     break
             if not is_exist:
-                name, image_data = self.__get_card_name_and_image_data(card, language if language else self.__language)
+                name, image_data, _ = self.__download_card_name_and_image_data(set, card, language if language else self.__language)
                 if name and image_data:
                     with Image.open(BytesIO(image_data)) as image:
                         format = image.format
-                        ext = self.FORMATS.get(format)
-                        if ext:
-                            path = join(dir, sub(r'["*/:<>?\\\|]', '-', name+self.FORMATS[format]))
-                            if not exists(path):
-                                image.save(path)
-                                names.append(name)
+                    ext = self.FORMATS.get(format)
+                    if ext:
+                        path = join(dir, sub(r'["*/:<>?\\\|]', '-', name+self.FORMATS[format]))
+                        if not exists(path):
+                            write_file_atomically(path, image_data)
+                            names.append(name)
         return names
 
     __CARD_BACK_IMAGE_MD5 = 'db0c48db407a907c16ade38de048a441'
     
+    def get_card(self, set, number):
+        return self.__get_card(set, number)
+
     def __get_card(self, set, number):
-        cards = self.get_set_cards(set)
-        if cards:
-            for card in cards:
-                if card.get('number') == str(number):
-                    return card
+        # コレクター番号（アルケミーは"A-"付き）の索引から引く
+        index = self.get_set_card_index(set)
+        if index:
+            return index.get(str(number))
         return None
 
     def get_set_cards(self, set):
+        set_cards = self.__get_cached_set_cards(set)
+        return set_cards[0] if set_cards else None
+
+    def get_set_card_index(self, set):
+        set_cards = self.__get_cached_set_cards(set)
+        return set_cards[1] if set_cards else None
+
+    def __get_cached_set_cards(self, set):
+        # セットのカード一覧は1プロセスで1回だけ読み込む。同時に要求された同じセットの読み込みは1回にまとめる
+        key = (self.__json_dir, set)
+        with self.__set_cards_cache_lock:
+            set_cards = self.__set_cards_cache.get(key)
+        if set_cards:
+            return set_cards
+        return self.__set_cards_flight.do(key, self.__load_and_index_set_cards, key)
+
+    def __load_and_index_set_cards(self, key):
+        with self.__set_cards_cache_lock:
+            set_cards = self.__set_cards_cache.get(key)
+        if set_cards:
+            return set_cards
+        cards = self.__load_set_cards(key[1])
+        if cards is None:
+            return None
+        index = {}
+        for card in cards:
+            # 同じコレクター番号が複数ある場合は先頭のカードを使う
+            if card.get('number') is not None:
+                index.setdefault(card.get('number'), card)
+        set_cards = (cards, index)
+        with self.__set_cards_cache_lock:
+            self.__set_cards_cache[key] = set_cards
+        return set_cards
+
+    def get_set_data_store(self):
+        # カード一覧の保存先（json_dir/set_data.sqlite3）。同じjson_dirのインスタンス間で共有する
+        with self.__set_cards_cache_lock:
+            store = self.__set_data_stores.get(self.__json_dir)
+            if store is None:
+                store = self.__set_data_stores[self.__json_dir] = SetDataStore(join(self.__json_dir, SetDataStore.FILE_NAME))
+            return store
+
+    def __load_set_cards(self, set):
+        store = self.get_set_data_store()
+        cards = store.get_set_cards(set)
+        if cards is not None:
+            return cards
+
+        # 変換前のセット毎のJSONが残っていれば取り込む
         json_path = join(self.__json_dir, set+'.json')
         if exists(json_path):
-            with open(json_path) as f:
-                set_cards = json.load(f)
-        else:
-            set_cards = {}
-        if set in set_cards.keys():
-            return set_cards[set]
-        else:
-            set_cards[set] = []
             try:
-                cards = Card.where(set=set).all()
-                for card in cards:
-                    entry = {}
-                    if card.foreign_names:
-                        entry['foreignNames'] = []
-                        for foreign_name in card.foreign_names:
-                            entry['foreignNames'].append(
-                                {
-                                    "name": foreign_name.get("name"),
-                                    "imageUrl": foreign_name.get("imageUrl"),
-                                    "language": foreign_name.get("language")
-                                }
-                            )
-                    entry['imageUrl'] = card.image_url
-                    entry['name'] = card.name
-                    entry['number'] = card.number
-                    set_cards[set].append(entry)
-                with open(json_path, 'w') as f:
-                    f.write(json.dumps(set_cards))
-                print("セット"+set+"カード一覧の取得に成功", flush=True)
-                return set_cards[set]
-            except Exception as e:
-                print("セット"+set+"カード一覧の取得に失敗", flush=True)
+                if set in store.import_json(json_path):
+                    return store.get_set_cards(set)
+            except (ValueError, AttributeError) as e:
                 print(e.args, flush=True)
-                return None
-    
+
+        try:
+            # mtgsdk(urllib.request)は読み込みが重いため、カード一覧の取得時にのみ読み込む
+            from mtgsdk import Card
+            cards = Card.where(set=set).all()
+            entries = []
+            for card in cards:
+                entry = {}
+                if card.foreign_names:
+                    entry['foreignNames'] = []
+                    for foreign_name in card.foreign_names:
+                        entry['foreignNames'].append(
+                            {
+                                "name": foreign_name.get("name"),
+                                "imageUrl": foreign_name.get("imageUrl"),
+                                "language": foreign_name.get("language")
+                            }
+                        )
+                entry['imageUrl'] = card.image_url
+                entry['name'] = card.name
+                entry['number'] = card.number
+                entries.append(entry)
+            store.save_set_cards(set, entries)
+            print("セット"+set+"カード一覧の取得に成功", flush=True)
+            return store.get_set_cards(set)
+        except Exception as e:
+            print("セット"+set+"カード一覧の取得に失敗", flush=True)
+            print(e.args, flush=True)
+            return None
+
     @classmethod
     def __get_card_name(cls, card, language):
         name = None
@@ -120,38 +215,59 @@ class CardImageDownloader():
         return name
 
     @classmethod
-    def __get_card_name_and_image_data(cls, card, language):
-        name = None
-        image_data = None
+    def get_image_candidates(cls, card, language):
+        # ダウンロードを試す(カード名, 画像URL)の順序。指定言語の画像、英語の画像の順
+        candidates = []
         if card:
             if card.get('foreignNames'):
                 for foreign_name in card['foreignNames']:
                     if foreign_name.get('language') == language:
-                        name = foreign_name.get('name')
-                        image_url = foreign_name.get('imageUrl')
-                        if image_url:
-                            image_data = cls.__download_image_data_from_url(image_url, name)
+                        if foreign_name.get('imageUrl'):
+                            candidates.append((foreign_name.get('name'), foreign_name.get('imageUrl')))
                         break
-            if image_data is None:
-                name = card.get('name')
-                image_url = card.get('imageUrl')
-                if image_url:
-                    image_data = cls.__download_image_data_from_url(image_url, name)
-        return name, image_data
+            if card.get('imageUrl'):
+                candidates.append((card.get('name'), card.get('imageUrl')))
+        return candidates
+
+    def __get_card_name_and_image_data(self, card, language):
+        reasons = []
+        for name, image_url in self.get_image_candidates(card, language):
+            image_data, reason = self.__download_image_data_from_url(image_url, name)
+            if image_data:
+                return name, image_data, None
+            reasons.append(reason)
+        return (card.get('name') if card else None), None, self.get_failure_reason(reasons)
 
     @classmethod
-    def __download_image_data_from_url(cls, image_url, name=None):
+    def get_failure_reason(cls, reasons):
+        # 画像URL毎の理由をまとめる。一時的なエラーを優先する（早めに再試行する）
+        if not reasons:
+            return ImageFailureReason.NO_URL
+        if ImageFailureReason.HTTP_ERROR in reasons:
+            return ImageFailureReason.HTTP_ERROR
+        return ImageFailureReason.CARD_BACK
+
+    def __download_image_data_from_url(self, image_url, name=None):
         try:
-            with urlopen(url=image_url) as response:
-                image_data = response.read()
-        except URLError as e:
-            image_data = None
-        except ConnectionError as e:
+            image_data = self.get_http_client().get(image_url)
+        except HTTPClientError as e:
             image_data = None
 
-        if image_data and md5(image_data).hexdigest() == cls.__CARD_BACK_IMAGE_MD5:
-            image_data = None
+        if self.is_card_back(image_data):
+            image_data, reason = None, ImageFailureReason.CARD_BACK
+        else:
+            reason = None if image_data else ImageFailureReason.HTTP_ERROR
+
+        self.print_download_result(image_url, image_data, name)
+        return image_data, reason
 
+    @classmethod
+    def is_card_back(cls, image_data):
+        # 画像が用意されていないカードはカードの裏面画像が返ってくる
+        return bool(image_data) and md5(image_data).hexdigest() == cls.__CARD_BACK_IMAGE_MD5
+
+    @classmethod
+    def print_download_result(cls, image_url, image_data, name=None):
         if image_data:
             if name:
                 print(name+"のダウンロードに成功", flush=True)
@@ -162,8 +278,6 @@ class CardImageDownloader():
                 print(name+"のダウンロードに失敗", flush=True)
             else:
                 print(image_url+"のダウンロードに失敗", flush=True)
-        
-        return image_data
 
 if __name__ == "__main__":
     #param = sys.argv
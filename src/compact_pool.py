@@ -0,0 +1,129 @@
+from array import array
+from collections import Counter
+import json
+import struct
+import sys
+
+class CompactPool():
+    # カードプールをmtga_idと枚数の配列で表す（Cardオブジェクトのリストより小さく、比較や保存が速い）
+
+    MAGIC = b"MLGCP1"
+    HEADER = struct.Struct("<6sI")  # magic, カード種類数
+
+    def __init__(self, mtga_ids=None, counts=None):
+        self.mtga_ids = array('I', mtga_ids if mtga_ids else [])
+        self.counts = array('I', counts if counts else [])
+        if len(self.mtga_ids) != len(self.counts):
+            raise ValueError("mtga_ids and counts must have the same length")
+
+    @classmethod
+    def from_mtga_ids(cls, mtga_ids):
+        # 出現順を保ったまま枚数をまとめる
+        counter = {}
+        for mtga_id in mtga_ids:
+            counter[mtga_id] = counter.get(mtga_id, 0) + 1
+        return cls(list(counter.keys()), list(counter.values()))
+
+    @classmethod
+    def from_cards(cls, cards):
+        return cls.from_mtga_ids([card.mtga_id for card in cards])
+
+    @classmethod
+    def from_counter(cls, counter):
+        mtga_ids = [mtga_id for mtga_id in counter.keys() if counter[mtga_id] > 0]
+        return cls(mtga_ids, [counter[mtga_id] for mtga_id in mtga_ids])
+
+    def to_counter(self):
+        return Counter(dict(zip(self.mtga_ids, self.counts)))
+
+    def to_mtga_ids(self):
+        mtga_ids = array('I')
+        for mtga_id, count in zip(self.mtga_ids, self.counts):
+            mtga_ids.extend([mtga_id] * count)
+        return mtga_ids
+
+    def to_cards(self, generator):
+        return generator.mtga_ids_to_cards(self.to_mtga_ids())
+
+    def items(self):
+        return zip(self.mtga_ids, self.counts)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __eq__(self, other):
+        return isinstance(other, CompactPool) and self.to_counter() == other.to_counter()
+
+    def __repr__(self):
+        return "<CompactPool: {} kinds, {} cards>".format(len(self.mtga_ids), len(self))
+
+    # バイナリ形式
+    def to_bytes(self):
+        mtga_ids = array('I', self.mtga_ids)
+        counts = array('I', self.counts)
+        if sys.byteorder == 'big':
+            mtga_ids.byteswap()
+            counts.byteswap()
+        return self.HEADER.pack(self.MAGIC, len(mtga_ids)) + mtga_ids.tobytes() + counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, n = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a compact pool")
+        offset = cls.HEADER.size
+        mtga_ids = array('I', data[offset:offset+n*4])
+        counts = array('I', data[offset+n*4:offset+n*8])
+        if len(mtga_ids) != n or len(counts) != n:
+            raise ValueError("Truncated compact pool")
+        if sys.byteorder == 'big':
+            mtga_ids.byteswap()
+            counts.byteswap()
+        return cls(mtga_ids, counts)
+
+    # JSON形式
+    def to_json(self):
+        return json.dumps({"mtgaIds": list(self.mtga_ids), "counts": list(self.counts)})
+
+    @classmethod
+    def from_json(cls, text):
+        obj = json.loads(text)
+        return cls(obj.get("mtgaIds"), obj.get("counts"))
+
+    # デッキリスト形式
+    def to_decklist(self, generator, is_sideboard=False):
+        lines = {}
+        for mtga_id, count in zip(self.mtga_ids, self.counts):
+            card = generator.catalog.get_card(mtga_id)
+            if card:
+                pretty_name = generator.ALCHEMY_PREFIX+card.pretty_name if card.is_rebalanced else card.pretty_name
+                key = pretty_name + " (" + card.set + ") " + str(card.set_number)
+                lines[key] = lines.get(key, 0) + count
+        decklist = ("デッキ" if not is_sideboard else "サイドボード")+"\n"
+        for key in lines.keys():
+            decklist += str(lines[key]) + " " + key + "\n"
+        return decklist
+
+    @classmethod
+    def from_decklist(cls, decklist, generator):
+        # カードを特定できない行があればValueError（黙って除くと、存在しないカードのデッキが正しく見える）
+        cards, unresolved = generator.resolve_decklist_cards(generator.decklist_to_decklist_cards(decklist))
+        if unresolved:
+            raise ValueError("Unknown cards: " + ", ".join(str(n) + " " + key for key, n in unresolved.items()))
+        return cls.from_cards(cards)
+
+    # 多重集合としての比較
+    def diff(self, other):
+        # (selfにだけあるカード, otherにだけあるカード)
+        mine = self.to_counter()
+        others = other.to_counter()
+        return self.from_counter(mine - others), self.from_counter(others - mine)
+
+    def get_invalid(self, deck, ignore_mtga_ids=()):
+        # deckのうち、このカードプールに含まれない(または枚数が超過している)カード
+        # mtga_id（版）単位で比較するため、カード名で比較し基本土地を除くリーグの検証(DeckValidator)より厳しい
+        # （別の版や基本土地も不正になる）。デッキの検証にはGenerator.validate/validate_decklistを使う
+        invalid = deck.to_counter() - self.to_counter()
+        for mtga_id in ignore_mtga_ids:
+            invalid.pop(mtga_id, None)
+        return self.from_counter(invalid)
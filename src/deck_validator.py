@@ -0,0 +1,93 @@
+from collections import Counter, namedtuple
+from decklist_parser import Section, tokenize_decklist
+
+# invalid_cards: カードプールにない(枚数超過を含む)カード {カード名: 枚数}
+# missing_cards: デッキリストで使われていないカードプールのカード {"カード名 (セット略号) コレクター番号": 枚数}
+# decklist: 不正カードを除外し、不足カードをサイドボードに追加したデッキリスト
+ValidationResult = namedtuple('ValidationResult', ['invalid_cards', 'missing_cards', 'decklist'])
+
+class DeckValidator():
+    # デッキリストとカードプールをカード名の多重集合(Counter)として比較する
+
+    def __init__(self, generator):
+        self.generator = generator
+
+    def summarize_pool(self, pool):
+        # カードプールを{"カード名 (セット略号) コレクター番号": (カード名, 枚数)}にまとめる
+        pool_keys = {}
+        for card in pool:
+            name = self.generator.ALCHEMY_PREFIX+card.pretty_name if card.is_rebalanced else card.pretty_name
+            key = name + " (" + card.set + ") " + str(card.set_number)
+            if key in pool_keys:
+                pool_keys[key] = (name, pool_keys[key][1] + 1)
+            else:
+                pool_keys[key] = (name, 1)
+        return pool_keys
+
+    def validate(self, decklist, pool, pool_keys=None):
+        if pool_keys is None:
+            pool_keys = self.summarize_pool(pool)
+        pool_names = Counter()
+        for name, n in pool_keys.values():
+            pool_names[name] += n
+
+        # デッキリストの枚数をセクション毎に集計する
+        sections = {Section.DECK: {}, Section.SIDEBOARD: {}}
+        key_names = {}
+        deck_names = Counter()
+        for entry in tokenize_decklist(decklist):
+            if entry.count == 0:
+                continue
+            section = sections[entry.section]
+            section[entry.key] = section.get(entry.key, 0) + entry.count
+            key_names[entry.key] = entry.name
+            deck_names[entry.name] += entry.count
+
+        # 不正カード（基本土地は除く）
+        invalid_cards = {}
+        for name, n in deck_names.items():
+            if name in self.generator.BASIC_LANDS:
+                continue
+            if n > pool_names[name]:
+                invalid_cards[name] = n - pool_names[name]
+
+        # 不正カードをサイドボード、デッキの順に除外する
+        used_names = Counter(deck_names)
+        if invalid_cards:
+            remaining = Counter(invalid_cards)
+            used_names = Counter()
+            for section in [sections[Section.SIDEBOARD], sections[Section.DECK]]:
+                for key in list(section.keys()):
+                    name = key_names[key]
+                    if remaining[name] > 0:
+                        n = min(section[key], remaining[name])
+                        section[key] -= n
+                        remaining[name] -= n
+                        if section[key] == 0:
+                            del section[key]
+                            continue
+                    used_names[name] += section[key]
+            decklist = (
+                self.generator.decklist_cards_to_decklist(sections[Section.DECK]) + "\n"
+                + self.generator.decklist_cards_to_decklist(sections[Section.SIDEBOARD], is_sideboard=True)
+            )
+
+        # デッキリストで使われていないカードプールのカード
+        missing_cards = {}
+        for key, (name, n) in pool_keys.items():
+            used = min(used_names[name], n)
+            used_names[name] -= used
+            if n > used:
+                missing_cards[key] = n - used
+
+        return ValidationResult(invalid_cards, missing_cards, self.generator.add_cards_to_sideboard(decklist, missing_cards))
+
+    def validate_many(self, submissions):
+        # submissions: (デッキリスト, カードプール)の列。同じカードプールの集計は使い回す
+        pool_keys_cache = {}
+        results = []
+        for decklist, pool in submissions:
+            if id(pool) not in pool_keys_cache:
+                pool_keys_cache[id(pool)] = (pool, self.summarize_pool(pool))
+            results.append(self.validate(decklist, pool, pool_keys_cache[id(pool)][1]))
+        return results
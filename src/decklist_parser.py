@@ -0,0 +1,51 @@
+from collections import namedtuple
+from functools import lru_cache
+
+class Section():
+    DECK = "deck"
+    SIDEBOARD = "sideboard"
+
+SIDEBOARD_HEADERS = ["サイドボード", "Sideboard"]
+ALCHEMY_PREFIX = "A-"
+
+class DecklistEntry(namedtuple('DecklistEntry', ['count', 'name', 'set', 'number', 'section', 'is_alchemy', 'line'])):
+    # MTGAのデッキリスト1行分（例: "2 A-ゼロ除算 (STX) 41"）
+    #   count: 枚数, name: カード名(アルケミーは"A-"付き), set: セット略号, number: コレクター番号
+    #   section: デッキ/サイドボード, is_alchemy: アルケミー版か, line: 元の行
+    __slots__ = ()
+
+    @property
+    def key(self):
+        # "カード名 (セット略号) コレクター番号"
+        if self.set is None:
+            return self.name
+        return self.name + " (" + self.set + ") " + self.number
+
+    @property
+    def set_number(self):
+        return int(self.number) if self.number and self.number.isdigit() else 0
+
+def parse_card_str(card_str):
+    # "カード名 (セット略号) コレクター番号" -> (カード名, セット略号, コレクター番号)
+    tokens = card_str.split()
+    if len(tokens) >= 3 and tokens[-2].startswith("(") and tokens[-2].endswith(")"):
+        return " ".join(tokens[0:-2]), tokens[-2].strip("()"), tokens[-1]
+    return " ".join(tokens), None, None
+
+@lru_cache(maxsize=256)
+def tokenize_decklist(decklist):
+    # デッキリストを1回の走査で解析する。枚数で始まらない行は見出しとして扱う
+    entries = []
+    section = Section.DECK
+    for line in decklist.splitlines():
+        if line in SIDEBOARD_HEADERS:
+            section = Section.SIDEBOARD
+            continue
+        if not line or not "0" <= line[0] <= "9":
+            continue
+        tokens = line.split(maxsplit=1)
+        if not tokens[0].isdigit():
+            continue
+        name, set, number = parse_card_str(tokens[1] if len(tokens) > 1 else "")
+        entries.append(DecklistEntry(int(tokens[0]), name, set, number, section, name.startswith(ALCHEMY_PREFIX), line))
+    return tuple(entries)
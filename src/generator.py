@@ -6,13 +6,20 @@ from hashlib import sha512
 from operator import attrgetter
 from os.path import exists, join
 from re import sub
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from PIL import Image, ImageDraw, ImageFont
 import random
-import re
-from mtga.set_data import all_mtga_cards
-from card_image_downloader import CardImageDownloader
-from io import BytesIO
+from card_image_downloader import CardImageDownloader, ImageFailureReason
+from http_client import HTTPClient
+from card_image_cache import CardImageCache
+from card_catalog import CardCatalog
+from pool_cache import PoolCache
+from tile_cache import TileCache
+from pool_store import PoolStore
+from compact_pool import CompactPool
+from decklist_parser import Section, parse_card_str, tokenize_decklist
+from deck_validator import DeckValidator
 
 class Rarity():
     TOKEN = "Token"
@@ -35,6 +42,14 @@ class Mode():
     RANDOM = "random"
     STATIC = "static"
 
+class Engine():
+    LEGACY = "legacy"
+    V2 = "v2"
+
+class Seeding():
+    POOL = "pool"   # セット毎に1つのシードから全パックを剥く（従来互換）
+    PACK = "pack"   # パック毎のシードで剥く（任意のパックを単独で生成可能）
+
 class Key():
     DECK = "deck"
     SIDEBOARD = "sideboard"
@@ -67,55 +82,176 @@ class Generator():
     MYTHIC_RARE_RATE = 1 / 7.4
     BASIC_LANDS = ["平地", "島", "沼", "山", "森", "Plains", "Island", "Swamp", "Mountain", "Forest"]
     ALCHEMY_PREFIX = "A-"
-
-    def __init__(self, pool=all_mtga_cards, card_image_cache_dir='.'):
-        self.downloader = CardImageDownloader(language='Japanese', json_dir='set_data')
-        self.cards = pool.cards
-        self.sets = self.get_sets()
+    CATALOG_SNAPSHOT_PATH = join("set_data", "mtga_catalog.pickle")
+
+    def __init__(self, pool=None, card_image_cache_dir='.', catalog_snapshot_path=CATALOG_SNAPSHOT_PATH, pool_cache_size=256, pool_cache_ttl=3600,
+                    download_workers=8, card_tile_cache_bytes=64*1024*1024, card_image_cache_max_bytes=None, card_image_cache_policy='lru'):
+        # カード画像のダウンロードはdownload_workers個のスレッドで行い、同時接続数も同じ数に制限する
+        # 待機中の接続も同じ数だけ保持し、次のダウンロードで全ての接続を使い回す（TLSの接続し直しを避ける）
+        self.download_workers = download_workers
+        self.downloader = CardImageDownloader(language='Japanese', json_dir='set_data', http_client=HTTPClient(max_connections=download_workers, max_idle_per_host=download_workers))
+        self.async_downloader = None
+        if pool is None:
+            self.catalog = CardCatalog.load_all_mtga_cards(catalog_snapshot_path)
+        else:
+            self.catalog = CardCatalog(pool.cards)
+        self.cards = self.catalog.cards
+        self.sets = self.catalog.sets
         self.set_info = {}
         for set in self.sets:
             self.set_info[set] = {}
-            cards = self.get_cards(set=set, rarity=Rarity.MYTHIC_RARE)
-            self.set_info[set][Rarity.MYTHIC_RARE] = len(cards)
-            cards = self.get_cards(set=set, rarity=Rarity.RARE)
-            self.set_info[set][Rarity.RARE] = len(cards)
-            cards = self.get_cards(set=set, rarity=Rarity.UNCOMMON)
-            self.set_info[set][Rarity.UNCOMMON] = len(cards)
-            cards = self.get_cards(set=set, rarity=Rarity.COMMON)
-            self.set_info[set][Rarity.COMMON] = len(cards)
-            cards = self.get_cards(set=set, rarity=Rarity.BASIC)
-            self.set_info[set][Rarity.BASIC] = len(cards)
+            for rarity in [Rarity.MYTHIC_RARE, Rarity.RARE, Rarity.UNCOMMON, Rarity.COMMON, Rarity.BASIC]:
+                self.set_info[set][rarity] = self.catalog.set_info[set].get(rarity, 0)
         self.card_image_cache_dir = card_image_cache_dir
+        # カード画像は保存時に描画用のRGBA画像(CardImageの大きさ)にも変換しておく（use_card_image_tiles=Falseで描画毎に変換）
+        # card_image_cache_max_bytesを指定すると、超えた分をcard_image_cache_policy(lru/lfu)に従って削除する
+        self.card_image_cache = CardImageCache(card_image_cache_dir, (CardImage.WIDTH, CardImage.HEIGHT), card_image_cache_max_bytes, card_image_cache_policy)
+        self.use_card_image_tiles = True
+        # 変換済みのRGBA画像はデコードしたものをメモリにも保持し、同じカードの再描画ではディスクを読まない
+        self.card_tile_cache = TileCache(card_tile_cache_bytes)
+        self.card_image_cache_migrated = False
+        self.card_image_cache_lock = Lock()
+        self.pool_cache = PoolCache(pool_cache_size, pool_cache_ttl)
+        self.pool_store = None
+        self.pool_store_lock = Lock()
+        self.validator = DeckValidator(self)
     
-    def add_card(self, set, rarity, picked_cards):
-        cards = self.get_cards(set=set, rarity=rarity)
+    def add_card(self, set, rarity, picked_cards, rng=None):
+        rng = rng if rng else random.Random()
+        cards = self.catalog.get_bucket(set, rarity)
         while True:
-            card = cards[random.randrange(0, len(cards))]
+            card = cards[rng.randrange(0, len(cards))]
             if card not in picked_cards:
                 picked_cards.append(card)
                 return picked_cards
+
+    def draw_cards(self, set, rarity, n, rng=None):
+        # 同じパック内で重複しないようにn枚を非復元抽出する
+        if n <= 0:
+            return []
+        rng = rng if rng else random.Random()
+        return rng.sample(self.catalog.get_bucket(set, rarity), n)
     
-    def open_boosters(self, user_id, sets, pack_nums, mode=None, index_dt=None):
+    def open_boosters(self, user_id, sets, pack_nums, mode=None, index_dt=None, engine=Engine.LEGACY, rng=None, seeding=Seeding.POOL):
+        # 乱数はグローバルな状態を使わず、呼び出し毎のRandomインスタンスを使う（スレッドセーフ）
+        rng = rng if rng else random.Random()
         pool = []
         for i in range(len(sets)):
             if sets[i] and pack_nums[i]:
-                # 乱数初期化
-                random.seed(self.get_seed(user_id, sets[i], mode, index_dt))
-                
-                # パックを剥く
                 cards = []
-                for _ in range(pack_nums[i]):
-                    cards += self.open_booster(sets[i])
+                if seeding == Seeding.POOL:
+                    # 乱数初期化
+                    rng.seed(self.get_seed(user_id, sets[i], mode, index_dt))
+                    
+                    # パックを剥く
+                    for _ in range(pack_nums[i]):
+                        cards += self.open_booster(sets[i], engine, rng)
+                elif seeding == Seeding.PACK:
+                    # パック毎に乱数を初期化して剥く
+                    for pack_index in range(pack_nums[i]):
+                        cards += self.open_pack(user_id, sets[i], pack_index, mode, index_dt, engine, rng)
+                else:
+                    raise ValueError("Unknown seeding: " + str(seeding))
                 cards = self.sort_cards_by_set_number(cards)
         
                 pool += cards
 
         return pool
 
-    def open_booster(self, set):
+    def get_pool(self, user_id, sets, pack_nums, mode=None, index_dt=None, engine=Engine.LEGACY, seeding=Seeding.POOL):
+        # カードプールは(ユーザーID, セット, パック数, 基準日時, エンジン, シード方式)で決まるため、キャッシュする
+        # 基準日時が現在日時になる場合（ランダム等）は毎回異なるカードプールになるため、キャッシュしない
+        if not self.has_fixed_index_datetime(mode, index_dt):
+            return self.open_boosters(user_id, sets, pack_nums, mode, index_dt, engine=engine, seeding=seeding)
+        key = (
+            user_id, tuple(sets), tuple(pack_nums), 
+            self.get_index_datetime(mode, index_dt).timestamp(), engine, seeding
+        )
+        # 一括生成済みのカードプールがあればそれを使う
+        pool_store = self.get_pool_store(sets, pack_nums, key[3], engine, seeding)
+        if pool_store:
+            mtga_ids = pool_store.get(user_id)
+            if mtga_ids is not None:
+                return self.mtga_ids_to_cards(mtga_ids)
+        pool = self.pool_cache.get(key)
+        if pool is None:
+            pool = self.open_boosters(user_id, sets, pack_nums, mode, index_dt, engine=engine, seeding=seeding)
+            self.pool_cache.put(key, pool, self.get_next_index_datetime(mode))
+        return pool
+
+    @classmethod
+    def has_fixed_index_datetime(cls, mode, index_dt=None):
+        # get_index_datetimeが現在日時ではなく、期間毎に決まった日時を返すか
+        return mode in [Mode.MONTHLY, Mode.WEEKLY, Mode.DAILY] or (mode == Mode.STATIC and index_dt is not None)
+
+    def get_compact_pool(self, user_id, sets, pack_nums, mode=None, index_dt=None, engine=Engine.LEGACY, seeding=Seeding.POOL):
+        # カードプールストアにあれば、Cardに変換せずmtga_idのまま返す
+        if self.has_fixed_index_datetime(mode, index_dt) and self.pool_store:
+            pool_store = self.get_pool_store(sets, pack_nums, self.get_index_datetime(mode, index_dt).timestamp(), engine, seeding)
+            if pool_store:
+                mtga_ids = pool_store.get(user_id)
+                if mtga_ids is not None:
+                    return CompactPool.from_mtga_ids(mtga_ids)
+        return CompactPool.from_cards(self.get_pool(user_id, sets, pack_nums, mode, index_dt, engine, seeding))
+
+    def open_pool_store(self, path):
+        if self.pool_store:
+            self.pool_store.close()
+        self.pool_store = PoolStore(path) if path else None
+        return self.pool_store
+
+    def get_pool_store(self, sets, pack_nums, timestamp, engine, seeding):
+        # 条件が一致するカードプールストアを返す
+        # リセット日時を跨いで一括生成し直した場合等、ファイルが置き換えられていれば再起動せずに開き直す
+        pool_store = self.pool_store
+        if pool_store is None:
+            return None
+        if pool_store.is_modified():
+            pool_store = self.reload_pool_store(pool_store)
+        if pool_store.matches(sets, pack_nums, timestamp, engine, seeding):
+            return pool_store
+        return None
+
+    def reload_pool_store(self, pool_store):
+        with self.pool_store_lock:
+            if self.pool_store is not pool_store:
+                # 他のスレッドが開き直した
+                return self.pool_store if self.pool_store else pool_store
+            try:
+                self.pool_store = PoolStore(pool_store.path)
+            except (OSError, ValueError) as e:
+                print("カードプールストアの読み込みに失敗", flush=True)
+                print(e.args, flush=True)
+                return pool_store
+            # 古いストアは読み込み中のスレッドがあるため閉じず、参照がなくなったときに解放する
+            return self.pool_store
+
+    def get_pool_cache_stats(self):
+        return self.pool_cache.get_stats()
+
+    def get_card_tile_cache_stats(self):
+        return self.card_tile_cache.get_stats()
+
+    def open_pack(self, user_id, set, pack_index, mode=None, index_dt=None, engine=Engine.LEGACY, rng=None):
+        # (ユーザーID, セット, 基準日時, パック番号)から決まるシードで、任意のパックを単独で剥く
+        rng = rng if rng else random.Random()
+        rng.seed(self.get_pack_seed(user_id, set, pack_index, mode, index_dt))
+        return self.open_booster(set, engine, rng)
+
+    def open_booster(self, set, engine=Engine.LEGACY, rng=None):
         if set and not self.sealedable(set):
             return None
 
+        rng = rng if rng else random.Random()
+        if engine == Engine.LEGACY:
+            return self.open_booster_legacy(set, rng)
+        elif engine == Engine.V2:
+            return self.open_booster_v2(set, rng)
+        else:
+            raise ValueError("Unknown engine: " + str(engine))
+
+    def open_booster_legacy(self, set, rng):
+        # 従来と同じ順序で乱数を消費する（同じシードからは同じカードプールになる）
         cards = []
 
         # レア/神話レア
@@ -124,92 +260,88 @@ class Generator():
                 cards = self.add_card(
                     set=set, 
                     rarity=Rarity.RARE, 
-                    picked_cards=cards
+                    picked_cards=cards,
+                    rng=rng
                 )
         else:
             for _ in range(N_IN_PACK.RARE):
                 cards = self.add_card(
                     set=set, 
-                    rarity=Rarity.MYTHIC_RARE if random.random() < self.MYTHIC_RARE_RATE else Rarity.RARE, 
-                    picked_cards=cards
+                    rarity=Rarity.MYTHIC_RARE if rng.random() < self.MYTHIC_RARE_RATE else Rarity.RARE, 
+                    picked_cards=cards,
+                    rng=rng
                 )
 
         # アンコモン
         for _ in range(N_IN_PACK.UNCOMMON):
-            cards = self.add_card(set=set, rarity=Rarity.UNCOMMON, picked_cards=cards)
+            cards = self.add_card(set=set, rarity=Rarity.UNCOMMON, picked_cards=cards, rng=rng)
         
         # コモン
         for _ in range(N_IN_PACK.COMMON):
-            cards = self.add_card(set=set, rarity=Rarity.COMMON, picked_cards=cards)
+            cards = self.add_card(set=set, rarity=Rarity.COMMON, picked_cards=cards, rng=rng)
 
         # 基本土地
         if set and self.set_info[set][Rarity.BASIC] > 0:
             for _ in range(N_IN_PACK.BASIC):
-                cards = self.add_card(set=set, rarity=Rarity.BASIC, picked_cards=cards)
+                cards = self.add_card(set=set, rarity=Rarity.BASIC, picked_cards=cards, rng=rng)
+
+        return cards
+
+    def open_booster_v2(self, set, rng):
+        # スロット毎に非復元抽出する（legacyとはカードプールが異なる）
+        cards = []
+
+        # レア/神話レア
+        n_mythic_rare = 0
+        if set and self.set_info[set][Rarity.MYTHIC_RARE] > 0:
+            for _ in range(N_IN_PACK.RARE):
+                if rng.random() < self.MYTHIC_RARE_RATE:
+                    n_mythic_rare += 1
+        cards += self.draw_cards(set, Rarity.MYTHIC_RARE, n_mythic_rare, rng)
+        cards += self.draw_cards(set, Rarity.RARE, N_IN_PACK.RARE - n_mythic_rare, rng)
+
+        # アンコモン
+        cards += self.draw_cards(set, Rarity.UNCOMMON, N_IN_PACK.UNCOMMON, rng)
+        
+        # コモン
+        cards += self.draw_cards(set, Rarity.COMMON, N_IN_PACK.COMMON, rng)
+
+        # 基本土地
+        if set and self.set_info[set][Rarity.BASIC] > 0:
+            cards += self.draw_cards(set, Rarity.BASIC, N_IN_PACK.BASIC, rng)
 
         return cards
 
     def get_cards(self, name="", pretty_name="", cost=None, color_identity=None, card_type="", sub_type="", super_type="",
                     ability="", set="", rarity="", collectible=True, set_number=0, mtga_id=0, 
                     is_token=False, is_secondary_card=False, is_rebalanced=False):
-        cards = []
-        for card in self.cards:
-            if name and card.name != name:
-                continue
-            if pretty_name and card.pretty_name != pretty_name:
-                continue
-            if cost and card.cost != cost:
-                continue
-            if color_identity and card.color_identity != color_identity:
-                continue
-            if card_type and card.card_type != card_type:
-                continue
-            if sub_type and not sub_type in card.sub_types:
-                continue
-            if super_type and not super_type in card.super_type:
-                continue
-            if ability and not ability in card.abilities:
-                continue
-            if set and card.set != set:
-                continue
-            if rarity and card.rarity != rarity:
-                continue
-            if card.collectible != collectible:
-                continue
-            if set_number and card.set_number != set_number:
-                continue
-            if mtga_id and card.mtga_id != mtga_id:
-                continue
-            if card.is_token != is_token:
-                continue
-            if card.is_secondary_card != is_secondary_card:
-                continue
-            if card.is_rebalanced != is_rebalanced:
-                continue
-            cards.append(card)
-        return cards
+        return self.catalog.get_cards(
+            name=name, pretty_name=pretty_name, cost=cost, color_identity=color_identity, card_type=card_type, 
+            sub_type=sub_type, super_type=super_type, ability=ability, set=set, rarity=rarity, collectible=collectible, 
+            set_number=set_number, mtga_id=mtga_id, is_token=is_token, is_secondary_card=is_secondary_card, is_rebalanced=is_rebalanced
+        )
     
     def get_sets(self):
-        sets = []
-        for card in self.get_cards():
-            if card.set and card.set not in sets:
-                sets.append(card.set)
-        return sets
+        return self.catalog.get_sets()
+
+    def mtga_ids_to_cards(self, mtga_ids):
+        cards = []
+        for mtga_id in mtga_ids:
+            card = self.catalog.get_card(mtga_id)
+            if card:
+                cards.append(card)
+        return cards
 
     def validate_decklist(self, decklist, pool):
-        decklist_pool = self.cards_to_decklist_cards(pool, True)
-        decklist_deck = self.decklist_to_decklist_cards(decklist, True)
-        invalid_cards = {}
-        for deck_key in decklist_deck:
-            if deck_key in self.BASIC_LANDS:
-                continue
-            elif deck_key in decklist_pool.keys():
-                num_diff = int(decklist_pool[deck_key]) - int(decklist_deck[deck_key])
-                if num_diff < 0:
-                    invalid_cards[deck_key] = abs(num_diff)
-            else:
-                invalid_cards[deck_key] = decklist_deck[deck_key]
-        return invalid_cards
+        return self.validator.validate(decklist, pool).invalid_cards
+
+    def validate(self, decklist, pool):
+        # 不正カード、不足カード、修正済みデッキリストを一度に求める
+        return self.validator.validate(decklist, pool)
+
+    def validate_many(self, submissions):
+        # submissions: (デッキリスト, カードプール)の列
+        return self.validator.validate_many(submissions)
     
     def sealedable(self, set):
         if self.set_info[set][Rarity.RARE] < N_IN_PACK.RARE:
@@ -221,7 +353,15 @@ class Generator():
         return True
 
     def decklist_cards_to_cards(self, decklist_cards, name_only=False):
+        rst, unresolved = self.resolve_decklist_cards(decklist_cards, name_only)
+        if unresolved:
+            print("カードが見つかりません: " + ", ".join(unresolved.keys()), flush=True)
+        return rst
+
+    def resolve_decklist_cards(self, decklist_cards, name_only=False):
+        # (カードのリスト, 見つからなかったデッキリストのカード{カード: 枚数})を返す
         rst = []
+        unresolved = {}
         for key in decklist_cards.keys():
             n = decklist_cards[key]
             if name_only:
@@ -229,25 +369,27 @@ class Generator():
                 set = ""
                 set_number = 0
             else:
-                name = " ".join(key.split()[0:-2])
-                set = key.split()[-2].strip("()")
-                set_number = int(key.split()[-1])
-            if name.startswith(self.ALCHEMY_PREFIX):
-                pretty_name = sub("^"+self.ALCHEMY_PREFIX, "", name)
-                is_rebalanced = True
-            else:
-                pretty_name = name
-                is_rebalanced = False
-            cards = self.get_cards(pretty_name=pretty_name, set=set, set_number=set_number, is_rebalanced=is_rebalanced)
-            if cards:
+                name, set, number = parse_card_str(key)
+                set = set if set else ""
+                set_number = int(number) if number and number.isdigit() else 0
+            card = self.resolve_card(name, set, set_number)
+            if card:
                 for _ in range(n):
-                    rst.append(cards[-1])
-        return rst
+                    rst.append(card)
+            else:
+                unresolved[key] = n
+        return rst, unresolved
+
+    def resolve_card(self, name, set="", set_number=0):
+        # カード名（アルケミーは"A-"付き）、セット略号、コレクター番号からカードを引く
+        if name.startswith(self.ALCHEMY_PREFIX):
+            return self.catalog.resolve(name[len(self.ALCHEMY_PREFIX):], True, set, set_number)
+        else:
+            return self.catalog.resolve(name, False, set, set_number)
 
     def strip_invalid_cards_from_decklist(self, decklist, invalid_cards):
-        deck, sideboard = self.separate_decklist_to_deck_and_sideboard(decklist)
-        deck_cards = self.decklist_to_decklist_cards(deck)
-        sideboard_cards = self.decklist_to_decklist_cards(sideboard)
+        deck_cards = self.decklist_to_decklist_cards(decklist, section=Section.DECK)
+        sideboard_cards = self.decklist_to_decklist_cards(decklist, section=Section.SIDEBOARD)
         sideboard_cards, invalid_cards = self.strip_invalid_cards_from_decklist_cards(sideboard_cards, invalid_cards)
         if invalid_cards:
             deck_cards, invalid_cards = self.strip_invalid_cards_from_decklist_cards(deck_cards, invalid_cards)
@@ -256,20 +398,26 @@ class Generator():
         return deck + "\n" + sideboard
     
     def strip_invalid_cards_from_decklist_cards(self, decklist_cards, invalid_cards):
+        names = {}
+        for decklist_card in decklist_cards.keys():
+            name, _, _ = parse_card_str(decklist_card)
+            if name in names:
+                names[name].append(decklist_card)
+            else:
+                names[name] = [decklist_card]
         for invalid_card in invalid_cards.keys():    # invalid_card: カード名
-            for decklist_card in decklist_cards.keys():  # decklist_card: カード名 (セット名) セット番号
-                if decklist_card.startswith(invalid_card+" "):
-                    if decklist_cards[decklist_card] > invalid_cards[invalid_card]:
-                        decklist_cards[decklist_card] -= invalid_cards[invalid_card]
-                        invalid_cards[invalid_card] = 0
-                        break
-                    elif decklist_cards[decklist_card] == invalid_cards[invalid_card]:
-                        decklist_cards[decklist_card] = 0
-                        invalid_cards[invalid_card] = 0
-                        break
-                    elif decklist_cards[decklist_card] < invalid_cards[invalid_card]:
-                        invalid_cards[invalid_card] -= decklist_cards[decklist_card]
-                        decklist_cards[decklist_card] = 0
+            for decklist_card in names.get(invalid_card, []):  # decklist_card: カード名 (セット名) セット番号
+                if decklist_cards[decklist_card] > invalid_cards[invalid_card]:
+                    decklist_cards[decklist_card] -= invalid_cards[invalid_card]
+                    invalid_cards[invalid_card] = 0
+                    break
+                elif decklist_cards[decklist_card] == invalid_cards[invalid_card]:
+                    decklist_cards[decklist_card] = 0
+                    invalid_cards[invalid_card] = 0
+                    break
+                elif decklist_cards[decklist_card] < invalid_cards[invalid_card]:
+                    invalid_cards[invalid_card] -= decklist_cards[decklist_card]
+                    decklist_cards[decklist_card] = 0
 
         for key in [k for k in decklist_cards.keys() if decklist_cards[k] == 0]:
             del decklist_cards[key]
@@ -286,6 +434,9 @@ class Generator():
 
     def add_diff_to_sideboard(self, decklist, pool):
         adding_cards = self.get_diff_cards(pool, decklist)
+        return self.add_cards_to_sideboard(decklist, adding_cards)
+
+    def add_cards_to_sideboard(self, decklist, adding_cards):
         adding_str = self.decklist_cards_to_decklist(adding_cards, is_sideboard=True)
         if "サイドボード\n" in decklist or "Sideboard\n" in decklist:
             adding_str = adding_str.replace("サイドボード\n", "").replace("Sideboard\n", "")
@@ -294,34 +445,26 @@ class Generator():
         return decklist + adding_str
     
     @classmethod
-    def decklist_to_decklist_cards(cls, decklist, name_only=False):
+    def decklist_to_decklist_cards(cls, decklist, name_only=False, section=None):
         decklist_cards = {}
-        decklist_lines = decklist.splitlines()
-        for line in decklist_lines:
-            if re.match(r'^[1-9]', line):
-                num = int(line.split()[0])
-                if name_only:
-                    decklist_card_str = " ".join(line.split()[1:-2])
-                else:
-                    decklist_card_str = " ".join(line.split()[1:])
-                if decklist_cards.get(decklist_card_str):   # デッキとサイドボードに分かれている可能性があるため
-                    decklist_cards[decklist_card_str] += num
-                else:
-                    decklist_cards[decklist_card_str] = num
+        for entry in tokenize_decklist(decklist):
+            if entry.count == 0 or (section and entry.section != section):
+                continue
+            decklist_card_str = entry.name if name_only else entry.key
+            if decklist_cards.get(decklist_card_str):   # デッキとサイドボードに分かれている可能性があるため
+                decklist_cards[decklist_card_str] += entry.count
+            else:
+                decklist_cards[decklist_card_str] = entry.count
         return decklist_cards
     
     @classmethod
     def parse_decklist(cls, decklist):  # rst[カード名] = [セット略号, コレクター番号]
         rst = {}
-        decklist_lines = decklist.splitlines()
-        for line in decklist_lines:
-            if re.match(r'^[1-9]', line):
-                splited_line = line.split()
-                name = " ".join(splited_line[1:-2])
-                if name not in rst.keys():
-                    set = splited_line[-2].strip("()")
-                    number = int(splited_line[-1])
-                    rst[name] = [set, number]
+        for entry in tokenize_decklist(decklist):
+            if entry.count == 0 or entry.set is None:
+                continue
+            if entry.name not in rst.keys():
+                rst[entry.name] = [entry.set, entry.set_number]
         return rst
 
     def download_decklist_card_image(self, decklist):
@@ -335,33 +478,23 @@ class Generator():
             if set not in sets:
                 sets.append(set)
 
-        # セット毎にカード画像を並列で取得
+        # セットのカード一覧、カード画像の順にワーカースレッドで並列に取得
         print("カード画像の取得を開始")
-        threads = []
-        for set in sets:
-            threads.append(Thread(target=self.download_set_card_image_from_parsed_decklist, args=(parsed_decklist, set)))
-            threads[-1].start()
-        for thread in threads:
-            thread.join()
-        print("カード画像の取得が完了")
-    
-    def download_set_card_image_from_parsed_decklist(self, parsed_decklist, set):
-        # セットのカード一覧を取得
-        self.downloader.get_set_cards(set)
-
-        # パースしたデッキリストの各カードについて、対象セットのカード画像を並列ダウンロード
-        threads = []
-        for key in parsed_decklist.keys():
-            if parsed_decklist[key][0] == set:
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            for _ in executor.map(self.downloader.get_set_cards, sets):
+                pass
+            futures = []
+            for key in parsed_decklist.keys():
                 name = key
-                number = parsed_decklist[key][1]
+                set, number = parsed_decklist[key]
                 if name.startswith(self.ALCHEMY_PREFIX):   # アルケミー対応
-                    #name = sub("^"+self.ALCHEMY_PREFIX, "", name, 1)
                     number = self.ALCHEMY_PREFIX+str(number)
-                threads.append(Thread(target=self.get_card_image_path, args=(name, set, number)))
-                threads[-1].start()
-        for thread in threads:
-            thread.join()
+                if self.use_card_image_tiles and self.card_tile_cache.contains(self.get_card_tile_key(set, number)):
+                    continue
+                futures.append(executor.submit(self.get_card_image_path, name, set, number))
+            for future in futures:
+                future.result()
+        print("カード画像の取得が完了")
 
     @classmethod
     def get_pack_num(cls, mode):
@@ -435,8 +568,19 @@ class Generator():
         )
 
     @classmethod
-    def get_hashed_int(cls, user_id, set, timestamp):
+    def get_pack_seed(cls, user_id, set, pack_index, mode, index_dt=None):
+        return cls.get_hashed_int(
+            user_id=user_id, 
+            set=set,
+            timestamp=cls.get_index_datetime(mode, index_dt).timestamp(),
+            pack_index=pack_index
+        )
+
+    @classmethod
+    def get_hashed_int(cls, user_id, set, timestamp, pack_index=None):
         hash_str = user_id + "@" + set + "@" + str(timestamp)
+        if pack_index is not None:
+            hash_str += "@" + str(pack_index)
         hash_bytes = hash_str.encode(encoding="utf-8")
         hashed_bytes = sha512(hash_bytes)
         hashed_int = int(hashed_bytes.hexdigest(), 16)
@@ -477,32 +621,28 @@ class Generator():
 
     @classmethod
     def sort_cards_by_set_number(cls, cards):
+        # コレクター番号順に並べる（同じ番号のカードは最初に出現したカードに揃える）
+        first_cards = {}
         set_numbers = []
-        results = []
         for card in cards:
             set_numbers.append(card.set_number)
+            if card.set_number not in first_cards:
+                first_cards[card.set_number] = card
         set_numbers.sort()
+        results = []
         for set_number in set_numbers:
-            for card in cards:
-                if card.set_number == set_number:
-                    results.append(card)
-                    break
+            results.append(first_cards[set_number])
         return results
     
     @classmethod
     def separate_decklist_to_deck_and_sideboard(cls, decklist):
-        is_deck = True
         deck = "デッキ\n"
         sideboard = "サイドボード\n"
-        decklist_lines = decklist.splitlines()
-        for line in decklist_lines:
-            if line in ["サイドボード", "Sideboard"]:
-                is_deck = False
-            elif re.match(r'^[0-9]', line):
-                if is_deck:
-                    deck += line + "\n"
-                else:
-                    sideboard += line + "\n"
+        for entry in tokenize_decklist(decklist):
+            if entry.section == Section.DECK:
+                deck += entry.line + "\n"
+            else:
+                sideboard += entry.line + "\n"
         return deck, sideboard
 
     @classmethod
@@ -565,9 +705,8 @@ class Generator():
             Key.SIDEBOARD: {}
         }
 
-        deck, sideboard = self.separate_decklist_to_deck_and_sideboard(decklist)
-        deck_cards = self.decklist_cards_to_cards(self.decklist_to_decklist_cards(deck))
-        sideboard_cards = self.decklist_cards_to_cards(self.decklist_to_decklist_cards(sideboard))
+        deck_cards = self.decklist_cards_to_cards(self.decklist_to_decklist_cards(decklist, section=Section.DECK))
+        sideboard_cards = self.decklist_cards_to_cards(self.decklist_to_decklist_cards(decklist, section=Section.SIDEBOARD))
         rst[Key.DECK] = self.cards_to_decklist_image_array(deck_cards)
         rst[Key.SIDEBOARD] = self.cards_to_decklist_image_array(sideboard_cards)
 
@@ -656,54 +795,174 @@ class Generator():
         return sub(r'["*/:<>?\\\|]', '-', card_name)
 
     def get_card_image_path(self, name, set, number):
-        # カード名の標準化
-        name = self.normalize_card_name(name)
+        card_image_entry = self.fetch_card_image_entry(name, set, number)
+        return card_image_entry.path if card_image_entry else None
 
-        # カード名.拡張子ファイルが存在する場合、そのパスを返す
-        for ext in self.downloader.FORMATS.values():
-            card_image_path = join(self.card_image_cache_dir, name + ext)
-            if exists(card_image_path):
-                return card_image_path
+    def fetch_card_image_entry(self, name, set, number, force_refresh=False):
+        # カード画像キャッシュの索引に(セット略号, コレクター番号, 言語)があれば、それを返す
+        card_image_entry = self.get_card_image_entry(set, number)
+        if card_image_entry and exists(card_image_entry.path):
+            return card_image_entry
+
+        # 前回取得できなかったカード画像は、有効期限内であればダウンロードしない
+        if not force_refresh and self.is_card_image_failed(set, number):
+            return None
 
-        # カード名.拡張子ファイルが存在しない場合、CardImageDownloaderでカード画像をダウンロードする
-        card_image_data = self.downloader.get_card_image_data(set, number)
+        # 索引にない場合、CardImageDownloaderでカード画像をダウンロードする
+        _, card_image_data, reason = self.downloader.get_card_name_image_data_and_failure_reason(set, number)
         if card_image_data:
-            with Image.open(BytesIO(card_image_data)) as card_image:
-                format = card_image.format
-            if self.downloader.FORMATS.get(format):
-                card_image_path = join(self.card_image_cache_dir, name + self.downloader.FORMATS[format])
-            else:
-                card_image_path = join(self.card_image_cache_dir, name)
-            with open(card_image_path, 'wb') as card_image_file:
-                card_image_file.write(card_image_data)
+            return self.save_card_image_entry(name, set, number, card_image_data)
+
+        # カード画像がダウンロードできなかった場合、理由を記録してNoneを返す
+        self.record_card_image_failure(name, set, number, reason)
+        return None
+
+    async def get_card_image_path_async(self, name, set, number):
+        # get_card_image_pathのasyncio版
+        card_image_path = self.find_card_image_path(set, number)
+        if card_image_path:
             return card_image_path
-        
-        # カード画像がダウンロードできなかった場合、Noneを返す
+        if self.is_card_image_failed(set, number):
+            return None
+        card_image_paths = await self.get_async_downloader().save_card_images(
+            [(name, set, number)], self.save_card_image_data, fail=self.record_card_image_failure
+        )
+        return card_image_paths[0]
+
+    async def download_decklist_card_image_async(self, decklist):
+        # download_decklist_card_imageのasyncio版。キャッシュにないカード画像をパイプラインでまとめて取得する
+        requests = []
+        parsed_decklist = self.parse_decklist(decklist)
+        for key in parsed_decklist.keys():
+            name = key
+            set, number = parsed_decklist[key]
+            if name.startswith(self.ALCHEMY_PREFIX):   # アルケミー対応
+                number = self.ALCHEMY_PREFIX+str(number)
+            if not self.find_card_image_path(set, number) and not self.is_card_image_failed(set, number):
+                requests.append((name, set, number))
+        return await self.get_async_downloader().save_card_images(requests, self.save_card_image_data, fail=self.record_card_image_failure)
+
+    def get_async_downloader(self):
+        if self.async_downloader is None:
+            # asyncioの読み込みは非同期版を使うときまで遅らせる
+            from async_card_image_downloader import AsyncCardImageDownloader
+            self.async_downloader = AsyncCardImageDownloader(self.downloader, fetch_workers=self.download_workers)
+        return self.async_downloader
+
+    def get_card_image_entry(self, set, number):
+        # 初回のみ、旧形式（カード名.拡張子）のキャッシュを取り込む
+        if not self.card_image_cache_migrated:
+            with self.card_image_cache_lock:
+                if not self.card_image_cache_migrated:
+                    if not self.card_image_cache.is_migrated():
+                        self.migrate_card_image_cache()
+                    self.card_image_cache_migrated = True
+        return self.card_image_cache.get(set, number, self.downloader.get_language())
+
+    def find_card_image_path(self, set, number):
+        card_image_entry = self.get_card_image_entry(set, number)
+        if card_image_entry and exists(card_image_entry.path):
+            return card_image_entry.path
         return None
 
+    def save_card_image_data(self, name, set, number, card_image_data):
+        card_image_entry = self.save_card_image_entry(name, set, number, card_image_data)
+        return card_image_entry.path if card_image_entry else None
+
+    def save_card_image_entry(self, name, set, number, card_image_data):
+        try:
+            return self.card_image_cache.put(set, number, self.downloader.get_language(), name, card_image_data)
+        except ValueError as e:
+            # 画像として読めないデータはHTTPエラーと同じく扱う
+            print(e.args, flush=True)
+            self.record_card_image_failure(name, set, number, ImageFailureReason.HTTP_ERROR)
+            return None
+
+    def is_card_image_failed(self, set, number):
+        return self.card_image_cache.get_failure(set, number, self.downloader.get_language()) is not None
+
+    def record_card_image_failure(self, name, set, number, reason):
+        self.card_image_cache.put_failure(set, number, self.downloader.get_language(), reason)
+
+    def refresh_card_images(self, set=None, number=None):
+        # 取得できなかったカード画像の記録を消して、次回の描画で再ダウンロードさせる
+        return self.card_image_cache.clear_failures(set, number, self.downloader.get_language())
+
+    def pin_card_image_sets(self, sets):
+        # 開催中のリーグのセット等、カード画像キャッシュの上限を超えても削除しないセットを指定する
+        self.card_image_cache.set_pinned_sets([set for set in sets if set])
+
+    def get_card_image_cache_report(self):
+        return self.card_image_cache.get_usage_report()
+
+    def migrate_card_image_cache(self):
+        # カード名（アルケミーは"A-"付き、ファイル名に使えない文字は置換）から全ての版の(セット略号, コレクター番号)を引けるようにする
+        names = {}
+        for card in self.cards:
+            if card.collectible and not card.is_token and not card.is_secondary_card:
+                pretty_name = self.ALCHEMY_PREFIX+card.pretty_name if card.is_rebalanced else card.pretty_name
+                number = self.ALCHEMY_PREFIX+str(card.set_number) if card.is_rebalanced else str(card.set_number)
+                names.setdefault(self.normalize_card_name(pretty_name), []).append((card.set, number))
+        return self.card_image_cache.migrate_name_keyed_images(lambda name: names.get(name, []), self.downloader.get_language())
+
+    def get_card_tile_key(self, set, number):
+        return (set, str(number), self.downloader.get_language())
+
+    def get_card_tile(self, name, set, number):
+        # 保存時にRGBA・カード画像サイズに変換済みの画像を返す（メモリになければカード画像キャッシュから読み込む）
+        key = self.get_card_tile_key(set, number)
+        card_tile = self.card_tile_cache.get(key)
+        if card_tile is None:
+            card_image_entry = self.fetch_card_image_entry(name, set, number)
+            if card_image_entry is None:
+                return None
+            card_tile = self.card_image_cache.open_tile(card_image_entry)
+            self.card_tile_cache.put(key, card_tile)
+        else:
+            # メモリから描画した場合もカード画像キャッシュの使用履歴に記録する（よく使うカードが削除されないように）
+            self.card_image_cache.record_access(*key)
+        return card_tile
+
     def composite_card_image(self, decklist_image, card, xy=(0, 0)):
         # カード画像ファイルが存在すれば、そのカード画像を合成する
         pretty_name = self.ALCHEMY_PREFIX+card.pretty_name if card.is_rebalanced else card.pretty_name
         set = card.set
         number = self.ALCHEMY_PREFIX+str(card.set_number) if card.is_rebalanced else card.set_number
-        card_image_path = self.get_card_image_path(pretty_name, set, number)
-        if card_image_path:
-            with Image.open(card_image_path) as card_image:
-                if card_image.width != CardImage.WIDTH or card_image.height != CardImage.HEIGHT:
-                    # 必要に応じてリサイズ
-                    card_image = card_image.resize((CardImage.WIDTH, CardImage.HEIGHT))
-                if card_image.format == 'PNG':
-                    return decklist_image.alpha_composite(card_image, xy)
-                else:
-                    # PNGでなければ貼り付け
-                    return decklist_image.paste(card_image, xy)
+        if self.use_card_image_tiles:
+            # 保存時にRGBA・カード画像サイズに変換済みの画像を合成する
+            card_tile = self.get_card_tile(pretty_name, set, number)
+            if card_tile:
+                return decklist_image.alpha_composite(card_tile, xy)
         else:
-            # カード画像ファイルが存在しなければダミー画像を合成する
-            card_image = self.generate_dummy_card_image(pretty_name)
-            return decklist_image.alpha_composite(card_image, xy)
+            card_image_entry = self.fetch_card_image_entry(pretty_name, set, number)
+            if card_image_entry:
+                with Image.open(card_image_entry.path) as card_image:
+                    if card_image.width != CardImage.WIDTH or card_image.height != CardImage.HEIGHT:
+                        # 必要に応じてリサイズ
+                        card_image = card_image.resize((CardImage.WIDTH, CardImage.HEIGHT))
+                    if card_image.format == 'PNG':
+                        return decklist_image.alpha_composite(card_image, xy)
+                    else:
+                        # PNGでなければ貼り付け
+                        return decklist_image.paste(card_image, xy)
+
+        # カード画像ファイルが存在しなければダミー画像を合成する
+        card_image = self.generate_dummy_card_image(pretty_name)
+        return decklist_image.alpha_composite(card_image, xy)
 
     def save_set_all_images(self, set):
-        names = self.downloader.save_set_all_images(set, self.card_image_cache_dir)
+        # セットの全カードのうち、カード画像キャッシュにないカード画像をダウンロードする
+        names = []
+        for card in self.downloader.get_set_cards(set) or []:
+            number = card.get('number')
+            if number is None or self.find_card_image_path(set, number) or self.is_card_image_failed(set, number):
+                continue
+            name, card_image_data, reason = self.downloader.get_card_name_image_data_and_failure_reason(set, number)
+            if card_image_data:
+                if self.save_card_image_data(name, set, number, card_image_data):
+                    names.append(name)
+            else:
+                self.record_card_image_failure(name, set, number, reason)
         return names
 
     @classmethod
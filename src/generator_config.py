@@ -1,5 +1,5 @@
 from config import ConfigFile
-from generator import Mode
+from generator import Engine, Mode, Seeding
 
 class ConfigKey():
     USER_ID = "userId"
@@ -10,6 +10,12 @@ class ConfigKey():
     PACK_NUMS = "packNums"
     CARD_IMAGE_CACHE_DIR = "cardImageCacheDir"
     DECKLIST_IMAGE_OUTPUT_DIR = "decklistImageOutputDir"
+    ENGINE = "engine"
+    SEEDING = "seeding"
+    POOL_STORE_PATH = "poolStorePath"
+    DOWNLOAD_WORKERS = "downloadWorkers"
+    CARD_IMAGE_CACHE_MAX_MB = "cardImageCacheMaxMB"
+    CARD_IMAGE_CACHE_POLICY = "cardImageCachePolicy"
 
 class GeneratorConfigFile(ConfigFile):
     def __init__(self, path=None):
@@ -22,5 +28,11 @@ class GeneratorConfigFile(ConfigFile):
             ConfigKey.PACK_MODE: 0, # 0:自動, 1:手動
             ConfigKey.PACK_NUMS: [ 6, 0, 0 ],
             ConfigKey.CARD_IMAGE_CACHE_DIR: "card_image",
-            ConfigKey.DECKLIST_IMAGE_OUTPUT_DIR: "."
+            ConfigKey.DECKLIST_IMAGE_OUTPUT_DIR: ".",
+            ConfigKey.ENGINE: Engine.LEGACY, # legacy: 従来互換, v2: 高速（カードプールが変わる）
+            ConfigKey.SEEDING: Seeding.POOL, # pool: 従来互換, pack: パック毎にシードを生成（カードプールが変わる）
+            ConfigKey.POOL_STORE_PATH: "", # 一括生成したカードプールストアのパス（空なら都度生成）
+            ConfigKey.DOWNLOAD_WORKERS: 8, # カード画像の同時ダウンロード数
+            ConfigKey.CARD_IMAGE_CACHE_MAX_MB: 0, # カード画像キャッシュの上限（0なら無制限）
+            ConfigKey.CARD_IMAGE_CACHE_POLICY: "lru" # 上限を超えたときに削除する順 lru: 最後に使われた日時が古い順, lfu: 使われた回数が少ない順
         }
@@ -0,0 +1,158 @@
+from argparse import ArgumentParser
+from datetime import datetime
+from hashlib import sha256, sha512
+import json
+import random
+from generator import Engine, Generator, Mode, N_IN_PACK, Rarity
+
+class GoldenPool():
+    # legacyエンジンが従来と同じカードプールを生成することを検証する
+    #   record: 索引導入前の実装(全件走査＋棄却ループ)でカードプールのダイジェストを記録する
+    #   verify: Generatorで同じシードのカードプールを生成し、記録したダイジェストと比較する
+
+    INDEX_DT = datetime(2022, 1, 1, tzinfo=Generator.TZ_UTC)
+    PACK_NUM = 6
+    USER_ID_FORMAT = "golden#{:05d}"
+    REFERENCE_MYTHIC_RARE_RATE = 1 / 7.4    # 索引導入前のGenerator.MYTHIC_RARE_RATE
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.__buckets = {}
+
+    def reference_get_cards(self, set, rarity):
+        # 索引導入前のGenerator.get_cards(set=set, rarity=rarity)と同じ全件走査
+        key = (set, rarity)
+        if key not in self.__buckets:
+            cards = []
+            for card in self.generator.cards:
+                if set and card.set != set:
+                    continue
+                if rarity and card.rarity != rarity:
+                    continue
+                if card.collectible != True:
+                    continue
+                if card.is_token != False:
+                    continue
+                if card.is_secondary_card != False:
+                    continue
+                if card.is_rebalanced != False:
+                    continue
+                cards.append(card)
+            self.__buckets[key] = cards
+        return self.__buckets[key]
+
+    def reference_add_card(self, rng, set, rarity, picked_cards):
+        cards = self.reference_get_cards(set, rarity)
+        while True:
+            card = cards[rng.randrange(0, len(cards))]
+            if card not in picked_cards:
+                picked_cards.append(card)
+                return picked_cards
+
+    def reference_open_booster(self, rng, set):
+        cards = []
+        if len(self.reference_get_cards(set, Rarity.MYTHIC_RARE)) == 0:
+            for _ in range(N_IN_PACK.RARE):
+                cards = self.reference_add_card(rng, set, Rarity.RARE, cards)
+        else:
+            for _ in range(N_IN_PACK.RARE):
+                rarity = Rarity.MYTHIC_RARE if rng.random() < self.REFERENCE_MYTHIC_RARE_RATE else Rarity.RARE
+                cards = self.reference_add_card(rng, set, rarity, cards)
+        for _ in range(N_IN_PACK.UNCOMMON):
+            cards = self.reference_add_card(rng, set, Rarity.UNCOMMON, cards)
+        for _ in range(N_IN_PACK.COMMON):
+            cards = self.reference_add_card(rng, set, Rarity.COMMON, cards)
+        if len(self.reference_get_cards(set, Rarity.BASIC)) > 0:
+            for _ in range(N_IN_PACK.BASIC):
+                cards = self.reference_add_card(rng, set, Rarity.BASIC, cards)
+        return cards
+
+    @classmethod
+    def reference_get_seed(cls, user_id, set, index_dt):
+        # 索引導入前のGenerator.get_seed(user_id, set, Mode.STATIC, index_dt)とGenerator.get_hashed_int
+        hash_str = user_id + "@" + set + "@" + str(index_dt.timestamp())
+        hash_bytes = hash_str.encode(encoding="utf-8")
+        hashed_bytes = sha512(hash_bytes)
+        hashed_int = int(hashed_bytes.hexdigest(), 16)
+        return hashed_int
+
+    @classmethod
+    def reference_sort_cards_by_set_number(cls, cards):
+        # 索引導入前のGenerator.sort_cards_by_set_number
+        set_numbers = []
+        results = []
+        for card in cards:
+            set_numbers.append(card.set_number)
+        set_numbers.sort()
+        for set_number in set_numbers:
+            for card in cards:
+                if card.set_number == set_number:
+                    results.append(card)
+                    break
+        return results
+
+    def reference_open_boosters(self, user_id, set, pack_num, index_dt=INDEX_DT):
+        # 現在のGeneratorの関数を使わない（Generator側の変更が記録にも反映されて検出できなくなるため）
+        rng = random.Random(self.reference_get_seed(user_id, set, index_dt))
+        cards = []
+        for _ in range(pack_num):
+            cards += self.reference_open_booster(rng, set)
+        return self.reference_sort_cards_by_set_number(cards)
+
+    @classmethod
+    def get_digest(cls, cards):
+        return sha256(",".join([str(card.mtga_id) for card in cards]).encode("utf-8")).hexdigest()
+
+    def get_sets(self):
+        return [set for set in self.generator.sets if self.generator.sealedable(set)]
+
+    def record(self, path, seed_num, sets=None):
+        golden = {
+            'indexTime': self.INDEX_DT.isoformat(),
+            'packNum': self.PACK_NUM,
+            'sets': {}
+        }
+        for set in sets if sets else self.get_sets():
+            golden['sets'][set] = []
+            for i in range(seed_num):
+                cards = self.reference_open_boosters(self.USER_ID_FORMAT.format(i), set, self.PACK_NUM)
+                golden['sets'][set].append(self.get_digest(cards))
+            print("セット"+set+"のカードプールを記録", flush=True)
+        with open(path, 'w') as f:
+            json.dump(golden, f, indent=1)
+        return golden
+
+    def verify(self, path, engine=Engine.LEGACY):
+        with open(path) as f:
+            golden = json.load(f)
+        index_dt = datetime.fromisoformat(golden['indexTime'])
+        mismatches = []
+        for set in golden['sets'].keys():
+            if set not in self.generator.sets:
+                mismatches.append((set, None))
+                continue
+            for i, digest in enumerate(golden['sets'][set]):
+                user_id = self.USER_ID_FORMAT.format(i)
+                cards = self.generator.open_boosters(user_id, [set], [golden['packNum']], Mode.STATIC, index_dt, engine=engine)
+                if self.get_digest(cards) != digest:
+                    mismatches.append((set, user_id))
+        return mismatches
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="legacyエンジンのカードプール回帰検証")
+    parser.add_argument("command", choices=["record", "verify"])
+    parser.add_argument("--path", default="golden_pools.json")
+    parser.add_argument("--seeds", type=int, default=2000)
+    parser.add_argument("--sets", nargs="*")
+    parser.add_argument("--engine", default=Engine.LEGACY)
+    args = parser.parse_args()
+
+    golden_pool = GoldenPool(Generator())
+    if args.command == "record":
+        golden_pool.record(args.path, args.seeds, args.sets)
+    else:
+        mismatches = golden_pool.verify(args.path, args.engine)
+        for set, user_id in mismatches:
+            print("不一致: " + set + " " + str(user_id), flush=True)
+        print("OK" if not mismatches else "NG: " + str(len(mismatches)) + "件", flush=True)
+        exit(1 if mismatches else 0)
@@ -0,0 +1,62 @@
+import json
+from os.path import join
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+import unittest
+from generator import Generator, Rarity
+from golden_pool import GoldenPool
+
+# legacyエンジンのカードプール回帰検証を、MTGAのカードデータの代わりに固定のカード一覧で実行する
+#   python -m unittest golden_pool_test
+SEED_NUM = 300
+
+def create_fixture_cards():
+    # 神話レアのあるセット(AAA)とないセット(BBB)。パックに入らないカード（トークン、非収録、アルケミー、両面の裏面）も混ぜる
+    cards = []
+
+    def add(set, rarity, num, **flags):
+        for _ in range(num):
+            mtga_id = len(cards) + 1
+            card = SimpleNamespace(
+                mtga_id=mtga_id, pretty_name=set + "-" + rarity + "-" + str(mtga_id), set=set, set_number=mtga_id,
+                rarity=rarity, collectible=True, is_token=False, is_secondary_card=False, is_rebalanced=False
+            )
+            for key, value in flags.items():
+                setattr(card, key, value)
+            cards.append(card)
+
+    for set, mythic_rare_num in [("AAA", 15), ("BBB", 0)]:
+        add(set, Rarity.MYTHIC_RARE, mythic_rare_num)
+        add(set, Rarity.RARE, 50)
+        add(set, Rarity.UNCOMMON, 80)
+        add(set, Rarity.COMMON, 100)
+        add(set, Rarity.BASIC, 5)
+        add(set, Rarity.TOKEN, 5, is_token=True)
+        add(set, Rarity.COMMON, 5, collectible=False)
+        add(set, Rarity.RARE, 5, is_rebalanced=True)
+        add(set, Rarity.UNCOMMON, 5, is_secondary_card=True)
+    return cards
+
+class GoldenPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.golden_pool = GoldenPool(Generator(pool=SimpleNamespace(cards=create_fixture_cards())))
+
+    def test_legacy_engine_matches_reference(self):
+        with TemporaryDirectory() as dir:
+            path = join(dir, "golden_pools.json")
+            golden = self.golden_pool.record(path, SEED_NUM)
+            self.assertEqual(sorted(golden['sets'].keys()), ["AAA", "BBB"])
+            self.assertEqual(self.golden_pool.verify(path), [])
+
+    def test_verify_detects_changed_pools(self):
+        with TemporaryDirectory() as dir:
+            path = join(dir, "golden_pools.json")
+            golden = self.golden_pool.record(path, 20)
+            golden['sets']["AAA"][3] = GoldenPool.get_digest([])
+            with open(path, 'w') as f:
+                json.dump(golden, f)
+            self.assertEqual(self.golden_pool.verify(path), [("AAA", GoldenPool.USER_ID_FORMAT.format(3))])
+
+if __name__ == "__main__":
+    unittest.main()
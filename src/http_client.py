@@ -0,0 +1,139 @@
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from threading import BoundedSemaphore, Lock
+from time import sleep
+from urllib.parse import urljoin, urlsplit
+
+class HTTPClientError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class HTTPClient():
+    # ホスト毎にKeep-Alive接続を使い回すGET専用のHTTPクライアント（スレッドセーフ）
+    #   max_connections: 全ホスト合計の同時リクエスト数の上限
+    #   max_idle_per_host: ホスト毎に保持する待機中の接続数
+    #   timeout: 1リクエストのタイムアウト（秒）
+    #   retries: 接続エラー、タイムアウト、429、5xxの再試行回数（待ち時間はbackoff秒から倍々に増やす）
+    RETRY_STATUSES = [429, 500, 502, 503, 504]
+    REDIRECT_STATUSES = [301, 302, 303, 307, 308]
+    MAX_REDIRECTS = 5
+    USER_AGENT = "SealedGenerator"
+
+    def __init__(self, max_connections=8, max_idle_per_host=4, timeout=10, retries=3, backoff=0.5):
+        self.max_connections = max_connections
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.__semaphore = BoundedSemaphore(max_connections)
+        self.__lock = Lock()
+        self.__idle_connections = {}
+        self.requests = 0
+        self.reused_connections = 0
+        self.retried_requests = 0
+
+    def get(self, url):
+        # レスポンスボディを返す。再試行しても取得できなければHTTPClientError
+        for _ in range(self.MAX_REDIRECTS + 1):
+            status, location, body = self.__get_with_retries(url)
+            if status in self.REDIRECT_STATUSES and location:
+                url = urljoin(url, location)
+                continue
+            if status != 200:
+                raise HTTPClientError(url + ": HTTP " + str(status), status)
+            return body
+        raise HTTPClientError(url + ": Too many redirects")
+
+    def __get_with_retries(self, url):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                with self.__lock:
+                    self.retried_requests += 1
+                sleep(self.backoff * (2 ** (attempt - 1)))
+            try:
+                status, location, body = self.__request(url)
+            except (OSError, HTTPException) as e:
+                error = HTTPClientError(url + ": " + repr(e))
+                continue
+            if status in self.RETRY_STATUSES:
+                error = HTTPClientError(url + ": HTTP " + str(status), status)
+                continue
+            return status, location, body
+        raise error
+
+    def __request(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ["http", "https"] or not parts.hostname:
+            raise HTTPClientError(url + ": Unsupported URL")
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        with self.__semaphore:
+            connection, is_reused = self.__acquire_connection(key)
+            try:
+                try:
+                    response = self.__send(connection, path, parts.netloc)
+                except (ConnectionError, HTTPException):
+                    if not is_reused:
+                        raise
+                    # 待機中にサーバーから切断された接続であれば、新しい接続でやり直す
+                    connection.close()
+                    connection, is_reused = self.__new_connection(key), False
+                    response = self.__send(connection, path, parts.netloc)
+                body = response.read()
+            except BaseException:
+                connection.close()
+                raise
+            with self.__lock:
+                self.requests += 1
+                if is_reused:
+                    self.reused_connections += 1
+            if response.will_close:
+                connection.close()
+            else:
+                self.__release_connection(key, connection)
+            return response.status, response.getheader("Location"), body
+
+    def __send(self, connection, path, host):
+        connection.request("GET", path, headers={"Host": host, "User-Agent": self.USER_AGENT, "Connection": "keep-alive"})
+        return connection.getresponse()
+
+    def __new_connection(self, key):
+        scheme, hostname, port = key
+        if scheme == "https":
+            return HTTPSConnection(hostname, port, timeout=self.timeout)
+        return HTTPConnection(hostname, port, timeout=self.timeout)
+
+    def __acquire_connection(self, key):
+        with self.__lock:
+            connections = self.__idle_connections.get(key)
+            if connections:
+                return connections.pop(), True
+        return self.__new_connection(key), False
+
+    def __release_connection(self, key, connection):
+        with self.__lock:
+            connections = self.__idle_connections.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.__lock:
+            for connections in self.__idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self.__idle_connections = {}
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                'requests': self.requests,
+                'reusedConnections': self.reused_connections,
+                'retriedRequests': self.retried_requests,
+                'idleConnections': sum(len(connections) for connections in self.__idle_connections.values())
+            }
@@ -0,0 +1,230 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter, sleep
+import asyncio
+import unittest
+from async_card_image_downloader import AsyncHTTPClient
+from http_client import HTTPClient, HTTPClientError
+
+# カード画像サーバーの代わりにlocalhostでhttp.serverを起動し、HTTPクライアントの接続の使い回し、再試行、リダイレクト、
+# タイムアウト、同時接続数の上限を確認する
+#   python -m unittest http_client_test
+BODY = b"image data"
+SLOW_SECONDS = 2
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests[self.path] = server.requests.get(self.path, 0) + 1
+            server.client_ports.add(self.client_address[1])
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            count = server.requests[self.path]
+        try:
+            if self.path.startswith("/flaky/"):
+                # 指定回数だけ503を返してから成功する
+                if count <= int(self.path.split("/")[2]):
+                    return self.send_body(503, b"")
+            elif self.path == "/redirect":
+                self.send_response(302)
+                self.send_header("Location", "/ok")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            elif self.path == "/redirect-loop":
+                self.send_response(302)
+                self.send_header("Location", "/redirect-loop")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            elif self.path == "/missing":
+                return self.send_body(404, b"")
+            elif self.path == "/slow":
+                sleep(SLOW_SECONDS)
+            elif self.path.startswith("/busy/"):
+                sleep(0.05)
+            self.send_body(200, BODY)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.client_ports = set()
+        self.active = 0
+        self.max_active = 0
+
+    def handle_error(self, request, client_address):
+        # タイムアウトしたクライアントへの書き込みエラー等は表示しない
+        pass
+
+    def url(self, path):
+        return "http://127.0.0.1:" + str(self.server_port) + path
+
+class HTTPClientTestBase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer()
+        cls.thread = Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.reset()
+
+class HTTPClientTest(HTTPClientTestBase):
+
+    def test_reuses_connections(self):
+        client = HTTPClient()
+        for _ in range(5):
+            self.assertEqual(client.get(self.server.url("/ok")), BODY)
+        self.assertEqual(len(self.server.client_ports), 1)
+        self.assertEqual(client.get_stats()['reusedConnections'], 4)
+        client.close()
+
+    def test_retries_503_with_backoff(self):
+        client = HTTPClient(retries=3, backoff=0.1)
+        start = perf_counter()
+        self.assertEqual(client.get(self.server.url("/flaky/2")), BODY)
+        self.assertGreaterEqual(perf_counter() - start, 0.1 + 0.2)
+        self.assertEqual(self.server.requests["/flaky/2"], 3)
+        self.assertEqual(client.get_stats()['retriedRequests'], 2)
+
+        # 再試行しても503であればHTTPClientError
+        client.retries, client.backoff = 1, 0
+        with self.assertRaises(HTTPClientError) as context:
+            client.get(self.server.url("/flaky/5"))
+        self.assertEqual(context.exception.status, 503)
+        client.close()
+
+    def test_does_not_retry_404(self):
+        client = HTTPClient(backoff=0)
+        with self.assertRaises(HTTPClientError) as context:
+            client.get(self.server.url("/missing"))
+        self.assertEqual(context.exception.status, 404)
+        self.assertEqual(self.server.requests["/missing"], 1)
+        client.close()
+
+    def test_follows_redirects(self):
+        client = HTTPClient()
+        self.assertEqual(client.get(self.server.url("/redirect")), BODY)
+        self.assertEqual(self.server.requests["/ok"], 1)
+        with self.assertRaises(HTTPClientError):
+            client.get(self.server.url("/redirect-loop"))
+        self.assertEqual(self.server.requests["/redirect-loop"], HTTPClient.MAX_REDIRECTS + 1)
+        client.close()
+
+    def test_timeout(self):
+        client = HTTPClient(timeout=0.3, retries=0)
+        start = perf_counter()
+        with self.assertRaises(HTTPClientError):
+            client.get(self.server.url("/slow"))
+        self.assertLess(perf_counter() - start, SLOW_SECONDS)
+        client.close()
+
+    def test_limits_concurrent_requests(self):
+        client = HTTPClient(max_connections=3)
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(client.get, [self.server.url("/busy/" + str(i)) for i in range(40)]))
+        self.assertEqual(results, [BODY] * 40)
+        self.assertLessEqual(self.server.max_active, 3)
+        self.assertLessEqual(len(self.server.client_ports), 3)
+        client.close()
+
+    def test_keeps_idle_connections_for_all_workers(self):
+        # 待機中の接続をワーカー数だけ保持すれば、2回目の同時ダウンロードで新しく接続しない
+        client = HTTPClient(max_connections=4, max_idle_per_host=4)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for burst in range(2):
+                list(executor.map(client.get, [self.server.url("/busy/" + str(burst) + "-" + str(i)) for i in range(4)]))
+        self.assertLessEqual(len(self.server.client_ports), 4)
+        self.assertGreaterEqual(client.get_stats()['reusedConnections'], 4)
+        client.close()
+
+class AsyncHTTPClientTest(HTTPClientTestBase):
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_reuses_connections(self):
+        async def run():
+            client = AsyncHTTPClient()
+            for _ in range(5):
+                self.assertEqual(await client.get(self.server.url("/ok")), BODY)
+            client.close()
+            return client.get_stats()
+        self.assertEqual(self.run_async(run())['reusedConnections'], 4)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_retries_503_with_backoff(self):
+        async def run():
+            client = AsyncHTTPClient(retries=3, backoff=0.1)
+            start = perf_counter()
+            self.assertEqual(await client.get(self.server.url("/flaky/2")), BODY)
+            self.assertGreaterEqual(perf_counter() - start, 0.1 + 0.2)
+            client.retries, client.backoff = 1, 0
+            with self.assertRaises(HTTPClientError) as context:
+                await client.get(self.server.url("/flaky/5"))
+            self.assertEqual(context.exception.status, 503)
+            client.close()
+        self.run_async(run())
+        self.assertEqual(self.server.requests["/flaky/2"], 3)
+
+    def test_follows_redirects(self):
+        async def run():
+            client = AsyncHTTPClient()
+            self.assertEqual(await client.get(self.server.url("/redirect")), BODY)
+            with self.assertRaises(HTTPClientError):
+                await client.get(self.server.url("/redirect-loop"))
+            client.close()
+        self.run_async(run())
+        self.assertEqual(self.server.requests["/redirect-loop"], AsyncHTTPClient.MAX_REDIRECTS + 1)
+
+    def test_timeout(self):
+        async def run():
+            client = AsyncHTTPClient(timeout=0.3, retries=0)
+            start = perf_counter()
+            with self.assertRaises(HTTPClientError):
+                await client.get(self.server.url("/slow"))
+            self.assertLess(perf_counter() - start, SLOW_SECONDS)
+            client.close()
+        self.run_async(run())
+
+    def test_limits_concurrent_requests(self):
+        async def run():
+            client = AsyncHTTPClient(max_connections=3)
+            results = await asyncio.gather(*[client.get(self.server.url("/busy/" + str(i))) for i in range(40)])
+            client.close()
+            return results
+        self.assertEqual(self.run_async(run()), [BODY] * 40)
+        self.assertLessEqual(self.server.max_active, 3)
+        self.assertLessEqual(len(self.server.client_ports), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from os import makedirs
+from os.path import exists, join
+import json
+import sys
+from generator import Engine, Generator, Mode, Seeding
+from pool_store import PoolStore
+
+# ワーカープロセス毎のGenerator（カード一覧はスナップショットから読み込む）
+_worker_generator = None
+
+def init_worker(pool=None, catalog_snapshot_path=Generator.CATALOG_SNAPSHOT_PATH):
+    global _worker_generator
+    _worker_generator = Generator(pool=pool, catalog_snapshot_path=catalog_snapshot_path)
+
+def open_pools(user_ids, sets, pack_nums, index_dt, engine, seeding):
+    # プロセス間はCardではなくmtga_idの配列でやり取りする
+    rst = []
+    for user_id in user_ids:
+        pool = _worker_generator.open_boosters(user_id, sets, pack_nums, Mode.STATIC, index_dt, engine=engine, seeding=seeding)
+        rst.append((user_id, [card.mtga_id for card in pool]))
+    return rst
+
+class LeagueBatch():
+    CHUNK_SIZE = 256
+    DT_FORMAT = '%Y-%m-%d %H:%M:%S %z'
+
+    def __init__(self, sets, pack_nums, mode, index_dt=None, engine=Engine.LEGACY, seeding=Seeding.POOL, workers=None,
+                    pool=None, catalog_snapshot_path=Generator.CATALOG_SNAPSHOT_PATH):
+        self.sets = sets
+        self.pack_nums = pack_nums
+        self.mode = mode
+        # バッチ途中でリセット日時を跨いでもカードプールが変わらないよう、基準日時は最初に確定させる
+        self.index_dt = Generator.get_index_datetime(mode, index_dt)
+        self.engine = engine
+        self.seeding = seeding
+        self.workers = workers
+        self.pool = pool
+        self.catalog_snapshot_path = catalog_snapshot_path
+        self.generator = Generator(pool=pool, catalog_snapshot_path=catalog_snapshot_path)
+
+    @classmethod
+    def load_roster(cls, path):
+        # 1行に1ユーザーID、空行は無視
+        user_ids = []
+        with open(path, 'r', encoding="utf_8_sig") as f:
+            for line in f:
+                user_id = line.strip()
+                if user_id:
+                    user_ids.append(user_id)
+        return user_ids
+
+    def generate(self, user_ids):
+        # (ユーザーID, mtga_idのリスト)を名簿順に返す
+        chunks = [user_ids[i:i+self.CHUNK_SIZE] for i in range(0, len(user_ids), self.CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self.pool, self.catalog_snapshot_path)) as executor:
+            futures = [
+                executor.submit(open_pools, chunk, self.sets, self.pack_nums, self.index_dt, self.engine, self.seeding)
+                for chunk in chunks
+            ]
+            for future in futures:
+                for user_id, mtga_ids in future.result():
+                    yield user_id, mtga_ids
+
+    def write_jsonl(self, user_ids, f):
+        n = 0
+        for user_id, mtga_ids in self.generate(user_ids):
+            f.write(json.dumps({
+                "userId": user_id,
+                "sets": self.sets,
+                "packNums": self.pack_nums,
+                "mode": self.mode,
+                "indexTime": self.index_dt.strftime(self.DT_FORMAT),
+                "engine": self.engine,
+                "seeding": self.seeding,
+                "mtgaIds": mtga_ids
+            }, ensure_ascii=False) + "\n")
+            n += 1
+        return n
+
+    def write_store(self, user_ids, path):
+        # validate_decklistやエクスポートがユーザーIDで引けるよう、カードプールストアに保存する
+        next_index_dt = Generator.get_next_index_datetime(self.mode) if self.mode != Mode.STATIC else None
+        meta = {
+            "sets": self.sets,
+            "packNums": self.pack_nums,
+            "mode": self.mode,
+            "indexTime": self.index_dt.strftime(self.DT_FORMAT),
+            "timestamp": self.index_dt.timestamp(),
+            "validUntil": next_index_dt.strftime(self.DT_FORMAT) if next_index_dt else None,
+            "engine": self.engine,
+            "seeding": self.seeding
+        }
+        return PoolStore.write(path, meta, self.generate(user_ids))
+
+    def write_decklists(self, user_ids, dir):
+        if not exists(dir):
+            makedirs(dir)
+        n = 0
+        for user_id, mtga_ids in self.generate(user_ids):
+            decklist = self.generator.cards_to_decklist(self.generator.mtga_ids_to_cards(mtga_ids))
+            with open(join(dir, Generator.normalize_card_name(user_id) + ".txt"), 'w', encoding="utf_8") as f:
+                f.write(decklist)
+            n += 1
+        return n
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="リーグ参加者全員のカードプールを一括生成する")
+    parser.add_argument("--roster", required=True, help="ユーザーID一覧ファイル（1行に1ユーザーID）")
+    parser.add_argument("--sets", nargs="+", required=True)
+    parser.add_argument("--pack-nums", nargs="+", type=int)
+    parser.add_argument("--mode", default=Mode.WEEKLY, choices=[Mode.MONTHLY, Mode.WEEKLY, Mode.DAILY, Mode.STATIC])
+    parser.add_argument("--index-time", help="基準開始日時（固定モードのみ）例: 2022-01-01 00:00:00 +0900")
+    parser.add_argument("--engine", default=Engine.LEGACY, choices=[Engine.LEGACY, Engine.V2])
+    parser.add_argument("--seeding", default=Seeding.POOL, choices=[Seeding.POOL, Seeding.PACK])
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--format", default="jsonl", choices=["jsonl", "decklist", "store"])
+    parser.add_argument("--output", default="-", help="jsonl: 出力ファイル（-で標準出力）, decklist: 出力フォルダ, store: カードプールストアファイル")
+    args = parser.parse_args()
+
+    pack_nums = args.pack_nums if args.pack_nums else [Generator.get_pack_num(args.mode)] + [0] * (len(args.sets) - 1)
+    if len(pack_nums) != len(args.sets):
+        parser.error("--pack-numsは--setsと同じ個数を指定してください")
+    if args.mode == Mode.STATIC and not args.index_time:
+        parser.error("固定モードでは--index-timeを指定してください")
+    index_dt = datetime.strptime(args.index_time, LeagueBatch.DT_FORMAT) if args.index_time else None
+
+    batch = LeagueBatch(args.sets, pack_nums, args.mode, index_dt, args.engine, args.seeding, args.workers)
+    user_ids = batch.load_roster(args.roster)
+    start_dt = datetime.now()
+    if args.format == "jsonl":
+        if args.output == "-":
+            n = batch.write_jsonl(user_ids, sys.stdout)
+        else:
+            with open(args.output, 'w', encoding="utf_8") as f:
+                n = batch.write_jsonl(user_ids, f)
+    elif args.format == "store":
+        if args.output == "-":
+            parser.error("storeでは--outputにファイルを指定してください")
+        n = batch.write_store(user_ids, args.output)
+    else:
+        n = batch.write_decklists(user_ids, args.output)
+    seconds = (datetime.now() - start_dt).total_seconds()
+    print(str(n) + "件のカードプールを生成（" + str(round(seconds, 2)) + "秒）", file=sys.stderr, flush=True)
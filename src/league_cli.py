@@ -0,0 +1,168 @@
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from time import perf_counter
+import json
+import sys
+
+# GUI(tkinter)やクリップボード(pyperclip)を読み込まないコマンドラインインターフェース
+#   python -m league_cli pool --user-id username#00000 --sets NEO
+#   python -m league_cli validate --user-id username#00000 --sets NEO decklist.txt
+#   python -m league_cli fix --user-id username#00000 --sets NEO decklist.txt
+#   python -m league_cli image --output decklist.png decklist.txt
+
+START_TIME = perf_counter()
+DT_FORMAT = '%Y-%m-%d %H:%M:%S %z'
+OUTPUT_STREAM = None
+
+def print_timing(args, label):
+    if args.timing:
+        print(label + ": " + str(round((perf_counter() - START_TIME) * 1000)) + "ms", file=sys.stderr, flush=True)
+
+def read_text(path):
+    if path == "-":
+        return sys.stdin.read()
+    with open(path, 'r', encoding="utf_8_sig") as f:
+        return f.read()
+
+def get_output_stream():
+    # コマンドの実行中はsys.stdoutを標準エラー出力に向けているため、結果は元の標準出力に書く
+    return OUTPUT_STREAM if OUTPUT_STREAM else sys.stdout
+
+def write_text(path, text):
+    if path == "-":
+        output = get_output_stream()
+        output.write(text)
+        output.flush()
+    else:
+        with open(path, 'w', encoding="utf_8") as f:
+            f.write(text)
+
+def get_generator(args):
+    # Generatorの読み込みは引数の解析後に行う（--helpや引数エラーを速く返すため）
+    from generator import Generator
+    print_timing(args, "import")
+    generator = Generator(card_image_cache_dir=args.card_image_cache_dir)
+    if getattr(args, "pool_store", None):
+        generator.open_pool_store(args.pool_store)
+    print_timing(args, "catalog")
+    return generator
+
+def get_pool(generator, args):
+    from datetime import datetime
+    from generator import Mode
+    pack_nums = args.pack_nums if args.pack_nums else [generator.get_pack_num(args.mode)] + [0] * (len(args.sets) - 1)
+    if len(pack_nums) != len(args.sets):
+        raise ValueError("--pack-numsは--setsと同じ個数を指定してください")
+    if args.mode == Mode.STATIC and not args.index_time:
+        raise ValueError("固定モードでは--index-timeを指定してください")
+    index_dt = datetime.strptime(args.index_time, DT_FORMAT) if args.index_time else None
+    return generator.get_pool(args.user_id, args.sets, pack_nums, args.mode, index_dt, engine=args.engine, seeding=args.seeding)
+
+def command_pool(args):
+    generator = get_generator(args)
+    pool = get_pool(generator, args)
+    write_text(args.output, generator.cards_to_decklist(pool))
+    return 0
+
+def command_validate(args):
+    generator = get_generator(args)
+    pool = get_pool(generator, args)
+    result = generator.validate(read_text(args.decklist), pool)
+    if args.json:
+        write_text(args.output, json.dumps({
+            "valid": not result.invalid_cards,
+            "invalidCards": result.invalid_cards,
+            "missingCards": result.missing_cards
+        }, ensure_ascii=False, indent=4) + "\n")
+    elif result.invalid_cards:
+        text = "以下のカードが不正です。\n"
+        for name, n in result.invalid_cards.items():
+            text += str(n) + " " + name + "\n"
+        write_text(args.output, text)
+    else:
+        write_text(args.output, "デッキリストは適正です。\n")
+    return 1 if result.invalid_cards else 0
+
+def command_fix(args):
+    # 不正カードを除外し、不足カードをサイドボードに追加したデッキリストを出力する
+    generator = get_generator(args)
+    pool = get_pool(generator, args)
+    result = generator.validate(read_text(args.decklist), pool)
+    write_text(args.output, result.decklist)
+    return 0
+
+def command_image(args):
+    generator = get_generator(args)
+    if args.refresh_images:
+        generator.refresh_card_images()
+    image = generator.generate_decklist_image_from_decklist(read_text(args.decklist))
+    if args.output == "-":
+        output = get_output_stream()
+        image.save(output.buffer, format="PNG")
+        output.flush()
+    else:
+        image.save(args.output, format="PNG")
+    return 0
+
+def add_pool_arguments(parser):
+    parser.add_argument("--user-id", required=True, help="ユーザー名#ID番号")
+    parser.add_argument("--sets", nargs="+", required=True)
+    parser.add_argument("--pack-nums", nargs="+", type=int)
+    parser.add_argument("--mode", default="daily", choices=["monthly", "weekly", "daily", "random", "static"])
+    parser.add_argument("--index-time", help="基準開始日時（固定モードのみ）例: 2022-01-01 00:00:00 +0900")
+    parser.add_argument("--engine", default="legacy", choices=["legacy", "v2"])
+    parser.add_argument("--seeding", default="pool", choices=["pool", "pack"])
+    parser.add_argument("--pool-store", help="一括生成したカードプールストア")
+
+def get_parser():
+    parser = ArgumentParser(prog="league_cli", description="Sealed Generatorのコマンドライン版")
+    parser.add_argument("--card-image-cache-dir", default="card_image")
+    parser.add_argument("--timing", action="store_true", help="起動時間を標準エラー出力に表示する")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pool_parser = subparsers.add_parser("pool", help="カードプールをデッキリスト形式で出力する")
+    add_pool_arguments(pool_parser)
+    pool_parser.add_argument("--output", default="-")
+    pool_parser.set_defaults(func=command_pool)
+
+    validate_parser = subparsers.add_parser("validate", help="デッキリストがカードプールのカードのみで構築されているか検証する")
+    add_pool_arguments(validate_parser)
+    validate_parser.add_argument("decklist", nargs="?", default="-", help="デッキリストファイル（-で標準入力）")
+    validate_parser.add_argument("--json", action="store_true")
+    validate_parser.add_argument("--output", default="-")
+    validate_parser.set_defaults(func=command_validate)
+
+    fix_parser = subparsers.add_parser("fix", help="不正カードを除外し、不足カードをサイドボードに追加する")
+    add_pool_arguments(fix_parser)
+    fix_parser.add_argument("decklist", nargs="?", default="-", help="デッキリストファイル（-で標準入力）")
+    fix_parser.add_argument("--output", default="-")
+    fix_parser.set_defaults(func=command_fix)
+
+    image_parser = subparsers.add_parser("image", help="デッキリスト画像を出力する")
+    image_parser.add_argument("decklist", nargs="?", default="-", help="デッキリストファイル（-で標準入力）")
+    image_parser.add_argument("--output", required=True, help="PNGファイル（-で標準出力）")
+    image_parser.add_argument("--refresh-images", action="store_true", help="前回取得できなかったカード画像も再ダウンロードする")
+    image_parser.set_defaults(func=command_image)
+
+    return parser
+
+def main(argv=None):
+    global OUTPUT_STREAM
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    print_timing(args, "parse")
+    # Generatorやカード画像のダウンロードの進捗表示(print)が結果（デッキリストやPNG）に混ざらないよう、標準エラー出力に回す
+    OUTPUT_STREAM = sys.stdout
+    try:
+        with redirect_stdout(sys.stderr):
+            status = args.func(args)
+    except ValueError as e:
+        print(str(e), file=sys.stderr, flush=True)
+        status = 2
+    finally:
+        OUTPUT_STREAM = None
+    print_timing(args, "total")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
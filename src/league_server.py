@@ -0,0 +1,264 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from io import BytesIO
+import asyncio
+import json
+import sys
+from generator import Engine, Generator, Mode, Seeding
+
+# デッキリストの受付用ボット等から使うローカルHTTPサービス
+#   POST /pool            {"userId", "sets", "packNums", "mode", "indexTime", "engine", "seeding"} -> {"pool"}
+#   POST /validate        カードプールの指定 + {"decklist"} -> {"valid", "invalidCards", "missingCards"}
+#   POST /fix-decklist    カードプールの指定 + {"decklist"} -> {"decklist"}
+#   POST /decklist-image  {"decklist"} -> image/png
+#   GET  /stats           カードプールキャッシュ・カード画像のメモリキャッシュの統計
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message if message else status.phrase)
+        self.status = status
+
+class LeagueServer():
+    DT_FORMAT = '%Y-%m-%d %H:%M:%S %z'
+    MODES = [Mode.MONTHLY, Mode.WEEKLY, Mode.DAILY, Mode.RANDOM, Mode.STATIC]
+    ENGINES = [Engine.LEGACY, Engine.V2]
+    SEEDINGS = [Seeding.POOL, Seeding.PACK]
+    MAX_BODY_SIZE = 1024 * 1024
+    READ_TIMEOUT = 30
+
+    def __init__(self, generator=None, host="127.0.0.1", port=8080, workers=4, max_concurrency=16):
+        # カード一覧とキャッシュを保持したGeneratorを全リクエストで共有する
+        self.generator = generator if generator else Generator(card_image_cache_dir="card_image")
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        self.server = None
+        self.routes = {
+            ("POST", "/pool"): self.handle_pool,
+            ("POST", "/validate"): self.handle_validate,
+            ("POST", "/fix-decklist"): self.handle_fix_decklist,
+            ("POST", "/decklist-image"): self.handle_decklist_image,
+            ("GET", "/stats"): self.handle_stats
+        }
+
+    async def start(self):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        print("http://" + self.host + ":" + str(self.port) + " で待ち受け中", file=sys.stderr, flush=True)
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+        self.executor.shutdown(wait=False)
+
+    async def run_in_executor(self, func, *args):
+        # カードプール生成や画像描画はイベントループを止めないようワーカースレッドで実行する
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # HTTP
+    async def handle_connection(self, reader, writer):
+        try:
+            try:
+                method, path, body = await asyncio.wait_for(self.read_request(reader), self.READ_TIMEOUT)
+                handler = self.routes.get((method, path))
+                if handler is None:
+                    if path in [route_path for _, route_path in self.routes.keys()]:
+                        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+                    raise HTTPError(HTTPStatus.NOT_FOUND)
+                async with self.semaphore:
+                    status, content_type, content = await handler(self.parse_json(body) if method == "POST" else {})
+            except HTTPError as e:
+                status, content_type, content = e.status, *self.to_json_content({"error": str(e)})
+            except asyncio.TimeoutError:
+                status, content_type, content = HTTPStatus.REQUEST_TIMEOUT, *self.to_json_content({"error": "Request timeout"})
+            except Exception as e:
+                # リクエストの誤りはHTTPErrorで返すため、それ以外はサーバーの不具合として扱う
+                print(e.args, file=sys.stderr, flush=True)
+                status, content_type, content = HTTPStatus.INTERNAL_SERVER_ERROR, *self.to_json_content({"error": "Internal server error"})
+            writer.write(
+                ("HTTP/1.1 " + str(status.value) + " " + status.phrase + "\r\n"
+                + "Content-Type: " + content_type + "\r\n"
+                + "Content-Length: " + str(len(content)) + "\r\n"
+                + "Connection: close\r\n\r\n").encode("latin-1")
+                + content
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            raise HTTPError(HTTPStatus.BAD_REQUEST)
+        method, path, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > self.MAX_BODY_SIZE:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method, path.split("?")[0], body
+
+    @classmethod
+    def parse_json(cls, body):
+        try:
+            obj = json.loads(body.decode("utf_8")) if body else {}
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid JSON")
+        if not isinstance(obj, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid JSON")
+        return obj
+
+    @classmethod
+    def to_json_content(cls, obj):
+        return "application/json; charset=utf-8", json.dumps(obj, ensure_ascii=False).encode("utf_8")
+
+    # パラメータ
+    @classmethod
+    def get_param(cls, params, name, type, default=None):
+        # パラメータを型を確認して返す（省略時はdefault、defaultもなければ400）
+        if name not in params or params[name] is None:
+            if default is None:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Missing parameter: " + name)
+            return default
+        value = params[name]
+        if not isinstance(value, type) or isinstance(value, bool):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid parameter: " + name)
+        return value
+
+    @classmethod
+    def get_list_param(cls, params, name, item_type, default=None, nullable=False):
+        # 要素の型も確認する（nullable=Trueの場合は要素のnullを許す）
+        value = cls.get_param(params, name, list, default)
+        for item in value:
+            if item is None and nullable:
+                continue
+            if not isinstance(item, item_type) or isinstance(item, bool):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid parameter: " + name)
+        return value
+
+    @classmethod
+    def get_choice_param(cls, params, name, choices, default):
+        value = cls.get_param(params, name, str, default)
+        if value not in choices:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid parameter: " + name + " must be one of " + ", ".join(choices))
+        return value
+
+    # エンドポイント
+    def get_pool(self, params):
+        # 指定の誤りはカードプールの生成前に400で返す（生成中の例外はサーバーの不具合として500）
+        user_id = self.get_param(params, "userId", str)
+        sets = self.get_list_param(params, "sets", str, nullable=True)
+        mode = self.get_choice_param(params, "mode", self.MODES, Mode.DAILY)
+        engine = self.get_choice_param(params, "engine", self.ENGINES, Engine.LEGACY)
+        seeding = self.get_choice_param(params, "seeding", self.SEEDINGS, Seeding.POOL)
+        pack_nums = self.get_list_param(params, "packNums", int, []) or [self.generator.get_pack_num(mode)] + [0] * (len(sets) - 1)
+        if len(pack_nums) != len(sets):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "packNums must have the same length as sets")
+        for set, pack_num in zip(sets, pack_nums):
+            if pack_num < 0:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid parameter: packNums must not be negative")
+            if not set or not pack_num:
+                continue
+            if set not in self.generator.sets:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Unknown set: " + set)
+            if not self.generator.sealedable(set):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Not enough cards to open booster packs: " + set)
+        index_time = self.get_param(params, "indexTime", str, "")
+        if mode == Mode.STATIC and not index_time:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "indexTime is required in static mode")
+        try:
+            index_dt = datetime.strptime(index_time, self.DT_FORMAT) if index_time else None
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid parameter: indexTime must be formatted as " + self.DT_FORMAT)
+        return self.generator.get_pool(user_id, sets, pack_nums, mode, index_dt, engine=engine, seeding=seeding)
+
+    def validate(self, params):
+        return self.generator.validate(self.get_param(params, "decklist", str), self.get_pool(params))
+
+    def generate_decklist_image(self, decklist):
+        image = self.generator.generate_decklist_image_from_decklist(decklist)
+        with BytesIO() as buffer:
+            image.save(buffer, format="PNG")
+            return buffer.getvalue()
+
+    async def handle_pool(self, params):
+        pool = await self.run_in_executor(self.get_pool, params)
+        return HTTPStatus.OK, *self.to_json_content({"pool": self.generator.cards_to_decklist(pool)})
+
+    async def handle_validate(self, params):
+        result = await self.run_in_executor(self.validate, params)
+        return HTTPStatus.OK, *self.to_json_content({
+            "valid": not result.invalid_cards,
+            "invalidCards": result.invalid_cards,
+            "missingCards": result.missing_cards
+        })
+
+    async def handle_fix_decklist(self, params):
+        result = await self.run_in_executor(self.validate, params)
+        return HTTPStatus.OK, *self.to_json_content({"decklist": result.decklist})
+
+    async def handle_decklist_image(self, params):
+        content = await self.run_in_executor(self.generate_decklist_image, self.get_param(params, "decklist", str))
+        return HTTPStatus.OK, "image/png", content
+
+    async def handle_stats(self, params):
+        return HTTPStatus.OK, *self.to_json_content({
+            "poolCache": self.generator.get_pool_cache_stats(),
+            "cardTileCache": self.generator.get_card_tile_cache_stats()
+        })
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Sealed GeneratorのローカルHTTPサービス")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4, help="カードプール生成・画像描画のワーカースレッド数")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="同時に処理するリクエスト数の上限")
+    parser.add_argument("--card-image-cache-dir", default="card_image")
+    parser.add_argument("--card-tile-cache-mb", type=int, default=64, help="デコード済みのカード画像をメモリに保持する上限(MB)")
+    parser.add_argument("--card-image-cache-max-mb", type=int, help="カード画像キャッシュの上限(MB)")
+    parser.add_argument("--card-image-cache-policy", default="lru", choices=["lru", "lfu"])
+    parser.add_argument("--pin-sets", nargs="+", help="カード画像キャッシュから削除しないセット（開催中のリーグのセット等）")
+    parser.add_argument("--pool-store", help="一括生成したカードプールストア")
+    args = parser.parse_args()
+
+    generator = Generator(
+        card_image_cache_dir=args.card_image_cache_dir,
+        card_tile_cache_bytes=args.card_tile_cache_mb*1024*1024,
+        card_image_cache_max_bytes=args.card_image_cache_max_mb*1024*1024 if args.card_image_cache_max_mb else None,
+        card_image_cache_policy=args.card_image_cache_policy
+    )
+    if args.pin_sets:
+        generator.pin_card_image_sets(args.pin_sets)
+    if args.pool_store:
+        generator.open_pool_store(args.pool_store)
+    server = LeagueServer(generator, args.host, args.port, args.workers, args.max_concurrency)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,145 @@
+from contextlib import redirect_stderr
+from http.client import HTTPConnection
+from io import StringIO
+from threading import Thread
+from types import SimpleNamespace
+import asyncio
+import json
+import unittest
+from generator import Generator, Rarity
+from league_server import LeagueServer
+
+# ローカルHTTPサービスをlocalhostの空きポートで起動し、HTTPクライアントからリクエストする
+#   python -m unittest league_server_test
+USER_ID = "user#00001"
+STATIC_PARAMS = {"userId": USER_ID, "sets": ["AAA"], "packNums": [2], "mode": "static", "indexTime": "2022-01-01 00:00:00 +0000"}
+
+def create_fixture_cards():
+    cards = []
+    for rarity, num in [(Rarity.MYTHIC_RARE, 10), (Rarity.RARE, 30), (Rarity.UNCOMMON, 40), (Rarity.COMMON, 60), (Rarity.BASIC, 5)]:
+        for _ in range(num):
+            mtga_id = len(cards) + 1
+            cards.append(SimpleNamespace(
+                mtga_id=mtga_id, pretty_name="Card" + str(mtga_id), set="AAA", set_number=mtga_id, rarity=rarity,
+                collectible=True, is_token=False, is_secondary_card=False, is_rebalanced=False
+            ))
+    # パックを剥くにはカードが足りないセット
+    cards.append(SimpleNamespace(
+        mtga_id=len(cards) + 1, pretty_name="Lonely Card", set="BBB", set_number=1, rarity=Rarity.RARE,
+        collectible=True, is_token=False, is_secondary_card=False, is_rebalanced=False
+    ))
+    return cards
+
+class LeagueServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.generator = Generator(pool=SimpleNamespace(cards=create_fixture_cards()))
+        cls.server = LeagueServer(cls.generator, port=0, workers=2)
+        cls.loop = asyncio.new_event_loop()
+        cls.loop.run_until_complete(cls.server.start())
+        cls.thread = Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.server.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+
+    def request(self, method, path, body=None):
+        connection = HTTPConnection(self.server.host, self.server.port, timeout=10)
+        try:
+            if body is not None and not isinstance(body, bytes):
+                body = json.dumps(body).encode("utf_8")
+            connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            content = response.read()
+            if response.getheader("Content-Type", "").startswith("application/json"):
+                content = json.loads(content.decode("utf_8"))
+            return response.status, content
+        finally:
+            connection.close()
+
+    def test_pool(self):
+        status, content = self.request("POST", "/pool", STATIC_PARAMS)
+        self.assertEqual(status, 200)
+        self.assertTrue(content["pool"].startswith("デッキ\n"))
+        # 同じ指定であれば同じカードプール
+        self.assertEqual(self.request("POST", "/pool", STATIC_PARAMS)[1], content)
+
+    def test_validate(self):
+        _, content = self.request("POST", "/pool", STATIC_PARAMS)
+        status, result = self.request("POST", "/validate", dict(STATIC_PARAMS, decklist=content["pool"]))
+        self.assertEqual(status, 200)
+        self.assertTrue(result["valid"])
+
+        status, result = self.request("POST", "/validate", dict(STATIC_PARAMS, decklist="デッキ\n1 Unknown Card (AAA) 999\n"))
+        self.assertEqual(status, 200)
+        self.assertFalse(result["valid"])
+
+    def test_invalid_parameter_types(self):
+        for path, body in [
+            ("/validate", dict(STATIC_PARAMS, decklist=5)),
+            ("/fix-decklist", dict(STATIC_PARAMS, decklist=["1 Card1 (AAA) 1"])),
+            ("/decklist-image", {"decklist": {"deck": []}}),
+            ("/pool", dict(STATIC_PARAMS, sets="AAA")),
+            ("/pool", dict(STATIC_PARAMS, sets=[1])),
+            ("/pool", dict(STATIC_PARAMS, packNums=["2"])),
+            ("/pool", dict(STATIC_PARAMS, packNums=[True])),
+            ("/pool", dict(STATIC_PARAMS, userId=1)),
+            ("/pool", dict(STATIC_PARAMS, indexTime=0)),
+            ("/pool", dict(STATIC_PARAMS, indexTime="2022-01-01")),
+            ("/pool", dict(STATIC_PARAMS, mode="hourly")),
+            ("/pool", dict(STATIC_PARAMS, engine="v3")),
+            ("/pool", dict(STATIC_PARAMS, seeding="set")),
+            ("/pool", dict(STATIC_PARAMS, packNums=[-1]))
+        ]:
+            with self.subTest(path=path, body=body):
+                status, content = self.request("POST", path, body)
+                self.assertEqual(status, 400)
+                self.assertIn("error", content)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.request("POST", "/pool", {"sets": ["AAA"]})[0], 400)      # userIdなし
+        self.assertEqual(self.request("POST", "/validate", STATIC_PARAMS)[0], 400)     # decklistなし
+        self.assertEqual(self.request("POST", "/pool", b"{")[0], 400)
+        self.assertEqual(self.request("POST", "/pool", b"[]")[0], 400)
+        self.assertEqual(self.request("POST", "/pool", dict(STATIC_PARAMS, packNums=[2, 2]))[0], 400)
+        self.assertEqual(self.request("GET", "/pool")[0], 405)
+        self.assertEqual(self.request("GET", "/unknown")[0], 404)
+
+    def test_invalid_sets(self):
+        status, content = self.request("POST", "/pool", dict(STATIC_PARAMS, sets=["ZZZ"]))
+        self.assertEqual(status, 400)
+        self.assertEqual(content["error"], "Unknown set: ZZZ")
+        status, content = self.request("POST", "/pool", dict(STATIC_PARAMS, sets=["BBB"]))
+        self.assertEqual(status, 400)
+        self.assertIn("BBB", content["error"])
+        # パック数0のセットは剥かないため、カードが足りなくてもよい
+        self.assertEqual(self.request("POST", "/pool", dict(STATIC_PARAMS, sets=["AAA", "BBB"], packNums=[2, 0]))[0], 200)
+
+    def test_internal_errors(self):
+        # サーバー内部の例外はリクエストの誤りとして返さない
+        original_get_pool = self.generator.get_pool
+        try:
+            for error in [KeyError("ZZZ"), ValueError("broken"), TypeError("'NoneType' object is not iterable")]:
+                def get_pool(*args, **kwargs):
+                    raise error
+                self.generator.get_pool = get_pool
+                with self.subTest(error=error), redirect_stderr(StringIO()):
+                    status, content = self.request("POST", "/pool", STATIC_PARAMS)
+                    self.assertEqual(status, 500)
+                    self.assertEqual(content["error"], "Internal server error")
+        finally:
+            self.generator.get_pool = original_get_pool
+
+    def test_stats(self):
+        status, content = self.request("GET", "/stats")
+        self.assertEqual(status, 200)
+        self.assertIn("poolCache", content)
+        self.assertIn("cardTileCache", content)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,7 +7,7 @@ from tkinter.ttk import Combobox, Entry, Label
 from generator import Generator, Mode
 from generator_config import GeneratorConfigFile, ConfigKey
 from pyperclip import copy, paste
-from os.path import dirname, sep
+from os.path import dirname, exists, sep
 from subprocess import Popen
 
 class GeneratorApp(Frame):
@@ -30,7 +30,14 @@ class GeneratorApp(Frame):
         # 変数
         self.config_file = GeneratorConfigFile(self.CONFIG_PATH)
         self.config = self.config_file.load()
-        self.generator = Generator(card_image_cache_dir=self.config.get(ConfigKey.CARD_IMAGE_CACHE_DIR))
+        self.generator = Generator(
+            card_image_cache_dir=self.config.get(ConfigKey.CARD_IMAGE_CACHE_DIR),
+            download_workers=self.config.get(ConfigKey.DOWNLOAD_WORKERS),
+            card_image_cache_max_bytes=self.config.get(ConfigKey.CARD_IMAGE_CACHE_MAX_MB)*1024*1024 if self.config.get(ConfigKey.CARD_IMAGE_CACHE_MAX_MB) else None,
+            card_image_cache_policy=self.config.get(ConfigKey.CARD_IMAGE_CACHE_POLICY)
+        )
+        if self.config.get(ConfigKey.POOL_STORE_PATH) and exists(self.config.get(ConfigKey.POOL_STORE_PATH)):
+            self.generator.open_pool_store(self.config.get(ConfigKey.POOL_STORE_PATH))
         self.sets = [""]
         for set in self.generator.get_sets():
             if self.generator.sealedable(set):
@@ -207,7 +214,7 @@ class GeneratorApp(Frame):
 
     def get_pool(self, sets):
         try:
-            pool = self.generator.open_boosters(
+            pool = self.generator.get_pool(
                 user_id=self.sv_user_id.get(),
                 sets=list(sets.keys()),
                 pack_nums=list(sets.values()),
@@ -215,7 +222,9 @@ class GeneratorApp(Frame):
                 index_dt=
                     datetime.strptime(self.sv_start_time.get(), self.DT_FORMAT)
                     if self.get_mode_key(self.sv_mode.get()) == Mode.STATIC
-                    else None
+                    else None,
+                engine=self.config.get(ConfigKey.ENGINE),
+                seeding=self.config.get(ConfigKey.SEEDING)
             )
             return pool
         except ValueError as e:
@@ -233,27 +242,22 @@ class GeneratorApp(Frame):
 
     def validate(self):
         self.save_config()
-        invalid_cards = []
         decklist = paste()
         if decklist:
             sets = self.get_sets()
             pool = self.get_pool(sets)
-            invalid_cards = self.generator.validate_decklist(decklist, pool)
-            diff_cards = self.generator.get_diff_cards(pool, decklist)
-            if not invalid_cards:
-                if not diff_cards:
+            result = self.generator.validate(decklist, pool)
+            if not result.invalid_cards:
+                if not result.missing_cards:
                     showinfo(self.APP_NAME, message="デッキリストは適正です。")
                 else:
                     if askyesno(self.APP_NAME, message="デッキリストは適正です。\n不足カードをサイドボードに追加したデッキリストをエクスポートしますか？"):
-                        decklist = self.generator.add_diff_to_sideboard(decklist, pool)
-                        copy(decklist)
+                        copy(result.decklist)
                         print(paste())
                         showinfo(self.APP_NAME, message="デッキリストがクリップボードにコピーされました。")
             else:
-                if askyesno(self.APP_NAME, message="以下のカードが不正です。\n\n"+str(invalid_cards)+"\n\n不正カードを除外したデッキリストをエクスポートしますか？"):
-                    decklist = self.generator.strip_invalid_cards_from_decklist(decklist, invalid_cards)
-                    decklist = self.generator.add_diff_to_sideboard(decklist, pool)
-                    copy(decklist)
+                if askyesno(self.APP_NAME, message="以下のカードが不正です。\n\n"+str(result.invalid_cards)+"\n\n不正カードを除外したデッキリストをエクスポートしますか？"):
+                    copy(result.decklist)
                     print(paste())
                     showinfo(self.APP_NAME, message="カードプールがクリップボードにコピーされました。")
 
@@ -298,6 +302,8 @@ class GeneratorApp(Frame):
                 self.config[ConfigKey.PACK_NUMS][i] = self.sv_pack_nums[i].get()
         self.config[ConfigKey.CARD_IMAGE_CACHE_DIR] = self.sv_card_image_cache_dir.get()
         self.config_file.save(self.config)
+        # 選択中のセットのカード画像はキャッシュの上限を超えても削除しない
+        self.generator.pin_card_image_sets(self.config[ConfigKey.SETS])
 
     def run(self):
         self.master.mainloop()
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from dateutil.tz import gettz
+
+class PoolCache():
+    TZ_UTC = gettz("UTC")
+
+    def __init__(self, max_size=256, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl  # 秒
+        self.__entries = OrderedDict()  # key: (有効期限, カードプール)
+        self.__lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = datetime.now(self.TZ_UTC)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_dt, pool = entry
+            if expires_dt <= now:
+                del self.__entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return list(pool)
+
+    def put(self, key, pool, expires_dt=None):
+        # 有効期限はTTLと次回リセット日時(expires_dt)の早い方
+        if self.max_size <= 0:
+            return
+        ttl_dt = datetime.now(self.TZ_UTC) + timedelta(seconds=self.ttl)
+        expires_dt = min(expires_dt, ttl_dt) if expires_dt else ttl_dt
+        with self.__lock:
+            self.__entries[key] = (expires_dt, tuple(pool))
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                "size": len(self.__entries),
+                "maxSize": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
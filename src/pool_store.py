@@ -0,0 +1,142 @@
+from array import array
+from hashlib import blake2b
+from io import BytesIO
+from mmap import ACCESS_READ, mmap
+from os import fstat, stat
+import json
+import struct
+import sys
+from single_flight import write_file_atomically
+
+class PoolStore():
+    # リーグ期間中の全ユーザーのカードプール(mtga_idの配列)を1ファイルに保存する
+    #   ヘッダ | メタデータ(JSON) | スロット表(オープンアドレス法のハッシュ表) | ユーザーID | mtga_id配列
+    # mmapで開くため、Cardオブジェクトを保持せずに任意のユーザーのカードプールをO(1)で引ける
+    # 書き込みは一時ファイルからの置き換えで行い、開いている側はis_modifiedで置き換えを検出して開き直す
+    # Windowsでは他のプロセスが開いている（mmap中の）ファイルを置き換えられないため、新しいパスに書き込んでから
+    # 読む側をそのパスに切り替える（Generator.open_pool_store、--pool-store）
+
+    MAGIC = b"MLGPOOL1"
+    HEADER = struct.Struct("<8sIIII")   # magic, メタデータ長, スロット数, エントリ数, 予約
+    SLOT = struct.Struct("<QIIII")      # ハッシュ, ユーザーID位置, ユーザーID長, mtga_id位置, mtga_id数
+
+    def __init__(self, path):
+        self.path = path
+        self.__file = open(path, 'rb')
+        self.__signature = self.__get_signature(fstat(self.__file.fileno()))
+        self.__mmap = mmap(self.__file.fileno(), 0, access=ACCESS_READ)
+        magic, meta_len, self.slot_num, self.entry_num, _ = self.HEADER.unpack_from(self.__mmap, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError("Not a pool store: " + path)
+        offset = self.HEADER.size
+        self.meta = json.loads(bytes(self.__mmap[offset:offset+meta_len]).decode("utf-8"))
+        self.__slot_offset = self.__align(offset + meta_len)
+        self.__name_offset = self.__slot_offset + self.SLOT.size * self.slot_num
+        self.__ids_offset = self.__align(self.__name_offset + self.meta["nameBytes"])
+
+    def close(self):
+        self.__mmap.close()
+        self.__file.close()
+
+    @classmethod
+    def __get_signature(cls, file_stat):
+        return (file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+
+    def is_modified(self):
+        # 開いた後にファイルが置き換えられたか（ファイルがなくなった場合は開き直せないため、置き換えられていないとする）
+        try:
+            return self.__get_signature(stat(self.path)) != self.__signature
+        except OSError:
+            return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self):
+        return self.entry_num
+
+    def get(self, user_id):
+        # ユーザーのmtga_id配列を返す。存在しなければNone
+        name = user_id.encode("utf-8")
+        hashed = self.__hash(name)
+        mask = self.slot_num - 1
+        i = hashed & mask
+        while True:
+            slot_hash, name_pos, name_len, ids_pos, ids_num = self.SLOT.unpack_from(self.__mmap, self.__slot_offset + self.SLOT.size * i)
+            if name_len == 0:
+                return None
+            if slot_hash == hashed and self.__mmap[self.__name_offset+name_pos:self.__name_offset+name_pos+name_len] == name:
+                start = self.__ids_offset + ids_pos * 4
+                mtga_ids = array('I', self.__mmap[start:start+ids_num*4])
+                if sys.byteorder == 'big':
+                    mtga_ids.byteswap()
+                return mtga_ids
+            i = (i + 1) & mask
+
+    def matches(self, sets, pack_nums, timestamp, engine, seeding):
+        # 保存したカードプールと同じ条件か
+        return (
+            self.meta.get("sets") == list(sets)
+            and self.meta.get("packNums") == list(pack_nums)
+            and self.meta.get("timestamp") == timestamp
+            and self.meta.get("engine") == engine
+            and self.meta.get("seeding") == seeding
+        )
+
+    @classmethod
+    def write(cls, path, meta, entries):
+        # entries: (ユーザーID, mtga_idのリスト)の列
+        # 空のユーザーIDは空きスロット（ユーザーID長0）と区別できないため、ValueError
+        names = bytearray()
+        ids = array('I')
+        positions = {}
+        for user_id, mtga_ids in entries:
+            if not user_id:
+                raise ValueError("Empty user id")
+            name = user_id.encode("utf-8")
+            positions[name] = (len(names), len(name), len(ids), len(mtga_ids))
+            names += name
+            ids.extend(mtga_ids)
+
+        slot_num = 1
+        while slot_num < len(positions) * 2:
+            slot_num *= 2
+        slots = [None] * slot_num
+        for name in positions.keys():
+            hashed = cls.__hash(name)
+            i = hashed & (slot_num - 1)
+            while slots[i] is not None:
+                i = (i + 1) & (slot_num - 1)
+            slots[i] = (hashed,) + positions[name]
+
+        meta = dict(meta)
+        meta["nameBytes"] = len(names)
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        with BytesIO() as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, len(meta_bytes), slot_num, len(positions), 0))
+            f.write(meta_bytes)
+            f.write(bytes(cls.__align(f.tell()) - f.tell()))
+            for slot in slots:
+                f.write(cls.SLOT.pack(*slot) if slot else bytes(cls.SLOT.size))
+            f.write(names)
+            f.write(bytes(cls.__align(f.tell()) - f.tell()))
+            if ids.itemsize != 4:
+                raise ValueError("array('I') must be 4 bytes")
+            if sys.byteorder == 'big':
+                ids.byteswap()
+            f.write(ids.tobytes())
+            # 同時に書き込む他のプロセスと一時ファイルが重ならないようにする
+            write_file_atomically(path, f.getvalue())
+        return len(positions)
+
+    @classmethod
+    def __hash(cls, name):
+        return int.from_bytes(blake2b(name, digest_size=8).digest(), "little")
+
+    @classmethod
+    def __align(cls, offset):
+        return (offset + 7) // 8 * 8
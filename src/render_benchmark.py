@@ -0,0 +1,84 @@
+from argparse import ArgumentParser
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import random
+from PIL import Image
+from card_image_cache import CardImageCache
+
+# カード画像の合成時間を、描画毎にデコード・リサイズする方式(before)と保存時に変換した画像を使う方式(after)で比較する
+#   python render_benchmark.py --cards 75 --rounds 10
+# Gathererの画像(223x310)を模した画像をカード画像キャッシュに保存し、デッキリスト画像1枚分の合成を繰り返す
+CARD_SIZE = (265, 370)
+HEIGHT_MARGIN = 74
+
+def generate_image_data(rng, size, format):
+    image = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    pixels = image.load()
+    for _ in range(2000):
+        pixels[rng.randrange(size[0]), rng.randrange(size[1])] = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    with BytesIO() as buffer:
+        image.save(buffer, format=format)
+        return buffer.getvalue()
+
+def composite_before(decklist_image, entry, xy):
+    # タイル導入前のGenerator.composite_card_imageと同じ処理
+    with Image.open(entry.path) as card_image:
+        if card_image.width != CARD_SIZE[0] or card_image.height != CARD_SIZE[1]:
+            card_image = card_image.resize(CARD_SIZE)
+        if card_image.format == 'PNG':
+            decklist_image.alpha_composite(card_image, xy)
+        else:
+            decklist_image.paste(card_image, xy)
+
+def composite_after(cache, decklist_image, entry, xy):
+    decklist_image.alpha_composite(cache.open_tile(entry), xy)
+
+def render(entries, composite):
+    # 7列にカードを重ねて並べる（デッキリスト画像と同程度の大きさ）
+    rows = (len(entries) + 6) // 7
+    decklist_image = Image.new('RGBA', (CARD_SIZE[0] * 7, HEIGHT_MARGIN * (rows - 1) + CARD_SIZE[1]))
+    for i, entry in enumerate(entries):
+        composite(decklist_image, entry, (CARD_SIZE[0] * (i % 7), HEIGHT_MARGIN * (i // 7)))
+    return decklist_image
+
+def benchmark(card_num, rounds, source_size, format, seed=0):
+    rng = random.Random(seed)
+    image_data = [generate_image_data(rng, source_size, format) for _ in range(card_num)]
+    with TemporaryDirectory() as dir:
+        plain_cache = CardImageCache(dir + "/plain")
+        start = perf_counter()
+        for i, data in enumerate(image_data):
+            plain_cache.put("BENCH", i, "Japanese", str(i), data)
+        ingest_before = perf_counter() - start
+
+        tile_cache = CardImageCache(dir + "/tile", CARD_SIZE)
+        start = perf_counter()
+        entries = [tile_cache.put("BENCH", i, "Japanese", str(i), data) for i, data in enumerate(image_data)]
+        ingest_after = perf_counter() - start
+
+        timings = {}
+        for label, composite in [("before", composite_before), ("after", lambda image, entry, xy: composite_after(tile_cache, image, entry, xy))]:
+            render(entries, composite)   # ウォームアップ（ファイルをOSのキャッシュに載せる）
+            start = perf_counter()
+            for _ in range(rounds):
+                render(entries, composite)
+            timings[label] = (perf_counter() - start) / rounds
+        plain_cache.close()
+        tile_cache.close()
+    return ingest_before, ingest_after, timings
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="カード画像の合成時間のベンチマーク")
+    parser.add_argument("--cards", type=int, default=75)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--source-size", type=int, nargs=2, default=[223, 310])
+    parser.add_argument("--format", default="JPEG", choices=["JPEG", "PNG"])
+    args = parser.parse_args()
+
+    ingest_before, ingest_after, timings = benchmark(args.cards, args.rounds, tuple(args.source_size), args.format)
+    print("カード" + str(args.cards) + "枚, 元画像 " + args.format + " " + str(args.source_size[0]) + "x" + str(args.source_size[1]))
+    print("保存 before: {:.1f}ms, after: {:.1f}ms".format(ingest_before * 1000, ingest_after * 1000))
+    print("描画 before: {:.1f}ms, after: {:.1f}ms ({:.1f}倍)".format(
+        timings["before"] * 1000, timings["after"] * 1000, timings["before"] / timings["after"]
+    ))
@@ -0,0 +1,138 @@
+from argparse import ArgumentParser
+from glob import glob
+from os import makedirs, remove
+from os.path import basename, dirname, getsize, join
+from threading import Lock
+import json
+import sqlite3
+import sys
+
+class SetDataStore():
+    # 全セットのカード一覧を1つのSQLiteファイルに保存する
+    # mtgsdkのカード情報のうち、カード名、コレクター番号、画像URLと各言語のカード名・画像URLのみを持つ
+    FILE_NAME = "set_data.sqlite3"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sets (
+            code TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS cards (
+            set_code TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            number TEXT,
+            name TEXT,
+            image_url TEXT,
+            PRIMARY KEY (set_code, position)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS cards_number ON cards (set_code, number);
+        CREATE TABLE IF NOT EXISTS foreign_names (
+            set_code TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            language TEXT NOT NULL,
+            name TEXT,
+            image_url TEXT,
+            PRIMARY KEY (set_code, position, language)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__connection = None
+        self.__lock = Lock()
+
+    def __get_connection(self):
+        if self.__connection is None:
+            if dirname(self.path):
+                makedirs(dirname(self.path), exist_ok=True)
+            self.__connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.__connection.executescript(self.SCHEMA)
+        return self.__connection
+
+    def close(self):
+        with self.__lock:
+            if self.__connection:
+                self.__connection.close()
+                self.__connection = None
+
+    def get_sets(self):
+        with self.__lock:
+            return [row[0] for row in self.__get_connection().execute("SELECT code FROM sets ORDER BY code")]
+
+    def get_set_cards(self, set):
+        # 保存済みでなければNone。カードはCardImageDownloaderのJSONと同じ形式の辞書で返す
+        with self.__lock:
+            connection = self.__get_connection()
+            if connection.execute("SELECT 1 FROM sets WHERE code = ?", (set,)).fetchone() is None:
+                return None
+            cards = []
+            for number, name, image_url in connection.execute(
+                "SELECT number, name, image_url FROM cards WHERE set_code = ? ORDER BY position", (set,)
+            ):
+                cards.append({'imageUrl': image_url, 'name': name, 'number': number})
+            for position, language, name, image_url in connection.execute(
+                "SELECT position, language, name, image_url FROM foreign_names WHERE set_code = ? ORDER BY position", (set,)
+            ):
+                cards[position].setdefault('foreignNames', []).append({"name": name, "imageUrl": image_url, "language": language})
+            return cards
+
+    def save_set_cards(self, set, cards):
+        # セットのカード一覧を置き換える
+        with self.__lock:
+            connection = self.__get_connection()
+            with connection:
+                connection.execute("DELETE FROM foreign_names WHERE set_code = ?", (set,))
+                connection.execute("DELETE FROM cards WHERE set_code = ?", (set,))
+                connection.execute("INSERT OR REPLACE INTO sets (code) VALUES (?)", (set,))
+                connection.executemany(
+                    "INSERT INTO cards (set_code, position, number, name, image_url) VALUES (?, ?, ?, ?, ?)",
+                    [(set, i, card.get('number'), card.get('name'), card.get('imageUrl')) for i, card in enumerate(cards)]
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO foreign_names (set_code, position, language, name, image_url) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (set, i, foreign_name.get('language'), foreign_name.get('name'), foreign_name.get('imageUrl'))
+                        for i, card in enumerate(cards) for foreign_name in (card.get('foreignNames') or [])
+                        if foreign_name.get('language')
+                    ]
+                )
+
+    def import_json(self, json_path):
+        # CardImageDownloaderが保存していたセット毎のJSON {セット略号: [カード, ...]} を取り込む
+        with open(json_path, encoding="utf_8") as f:
+            set_cards = json.load(f)
+        for set, cards in set_cards.items():
+            self.save_set_cards(set, cards)
+        return list(set_cards.keys())
+
+    def vacuum(self):
+        with self.__lock:
+            self.__get_connection().execute("VACUUM")
+
+    @classmethod
+    def migrate(cls, json_dir, remove_json=False):
+        # json_dir内のセット毎のJSONをjson_dir/set_data.sqlite3に変換する
+        store = cls(join(json_dir, cls.FILE_NAME))
+        json_size = 0
+        sets = []
+        for json_path in sorted(glob(join(json_dir, '*.json'))):
+            try:
+                imported_sets = store.import_json(json_path)
+            except (ValueError, AttributeError) as e:
+                print(basename(json_path)+"の変換に失敗", e.args, file=sys.stderr, flush=True)
+                continue
+            sets += imported_sets
+            json_size += getsize(json_path)
+            if remove_json:
+                remove(json_path)
+        store.vacuum()
+        store.close()
+        return sets, json_size, getsize(store.path)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="セット毎のカード一覧JSONをSQLiteファイルに変換する")
+    parser.add_argument("--json-dir", default="set_data")
+    parser.add_argument("--remove-json", action="store_true", help="変換後に元のJSONを削除する")
+    args = parser.parse_args()
+
+    sets, json_size, store_size = SetDataStore.migrate(args.json_dir, args.remove_json)
+    print(str(len(sets)) + "セットを変換: " + " ".join(sets), flush=True)
+    print("JSON " + str(json_size) + " bytes -> " + SetDataStore.FILE_NAME + " " + str(store_size) + " bytes", flush=True)
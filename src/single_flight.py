@@ -0,0 +1,61 @@
+from os import getpid, remove, replace
+from os.path import exists
+from threading import Event, Lock, get_ident
+
+class SingleFlight():
+    # 同じキーの処理が実行中であれば新たに実行せず、実行中の処理の結果を待って共有する（完了後の結果は保持しない）
+
+    class Call():
+        def __init__(self):
+            self.event = Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__calls = {}
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key, func, *args):
+        with self.__lock:
+            call = self.__calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self.__calls[key] = self.Call()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not is_leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.event.set()
+
+    def get_stats(self):
+        with self.__lock:
+            return {'inFlight': len(self.__calls), 'executions': self.executions, 'shared': self.shared}
+
+def write_file_atomically(path, data):
+    # 同じフォルダの一時ファイルに書き込んでから置き換える（書きかけのファイルを他から読ませない）
+    tmp_path = path + '.' + str(getpid()) + '.' + str(get_ident()) + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        replace(tmp_path, path)
+    except BaseException:
+        if exists(tmp_path):
+            remove(tmp_path)
+        raise
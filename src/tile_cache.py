@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from threading import Lock
+
+class TileCache():
+    # デコード済みのカード画像(PIL.Image)をメモリに保持するLRUキャッシュ
+    #   max_bytes: 保持する画像データの合計バイト数の上限（超えたら最も長く使われていない画像から捨てる）
+    # 保持した画像は複数のデッキリスト画像の合成で共有するため、呼び出し側で変更しないこと
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.__entries = OrderedDict()  # key: (画像, バイト数)
+        self.__lock = Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def get_image_bytes(cls, image):
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def contains(self, key):
+        # 統計と使用順に影響を与えずに、保持しているかを返す
+        with self.__lock:
+            return key in self.__entries
+
+    def put(self, key, image):
+        size = self.get_image_bytes(image)
+        if size > self.max_bytes:
+            return
+        with self.__lock:
+            old_entry = self.__entries.pop(key, None)
+            if old_entry:
+                self.bytes -= old_entry[1]
+            self.__entries[key] = (image, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self.__entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def remove(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry:
+                self.bytes -= entry[1]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                "size": len(self.__entries),
+                "bytes": self.bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }